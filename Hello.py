@@ -14,11 +14,34 @@
 import folium
 import streamlit as st
 from streamlit.logger import get_logger
-from streamlit_folium import st_folium
+
+from map_embed import render_html, static_map
 
 LOGGER = get_logger(__name__)
 
 
+@st.cache_data
+def restaurant_map_html():
+    # Some restaurants I like around Dublin
+    m = folium.Map(location=[37.70286733532977, -121.87460047508559], zoom_start=13)
+    snow_icon = folium.map.Icon(color='lightblue')
+    # folium.Marker(location=[37.70286733532977, -121.87460047508559], popup="Snowflake", icon=snow_icon
+    # ).add_to(m)
+    folium.Marker(
+        [37.69562641280019, -121.85025333314333], popup="Yin Ji Chang Fen", tooltip="Healthy & light"
+    ).add_to(m)
+    folium.Marker(
+        [37.70407465648592, -121.86595372989773], popup="Mayflower Restaurant", tooltip="Good Dimsum"
+    ).add_to(m)
+    folium.Marker(
+        [37.70528970455323, -121.8816482744688], popup="Cafe Tazza", tooltip="Authentic Indian"
+    ).add_to(m)
+    folium.Marker(
+        [37.677234124306, -121.89701156642151], popup="Sato Japanese Restaurant", tooltip="Authentic Japanese"
+    ).add_to(m)
+    return render_html(m)
+
+
 def run():
     st.set_page_config(
         page_title="Hello",
@@ -52,30 +75,13 @@ def run():
     )
     with row1[1]:        
         st.markdown("##### Restaurants I enjoy near Dublin, CA:  ")
-        # Some restaurants I like around Dublin
-
-        m = folium.Map(location=[37.70286733532977, -121.87460047508559], zoom_start=13)
         st.write("🥡 Yin Ji Chang Fen: Healthy & light Cantonese food.")
         st.write("🥟 Mayflower Restaurant: Good Dimsum.")
         st.write("🍛 Cafe Tazza: Authentic Indian food.")
         st.write("🍣 Sato Japanese Restaurant: Authentic Japanese sushi.")
-        snow_icon = folium.map.Icon(color='lightblue')
-        # folium.Marker(location=[37.70286733532977, -121.87460047508559], popup="Snowflake", icon=snow_icon
-        # ).add_to(m)
-        folium.Marker(
-            [37.69562641280019, -121.85025333314333], popup="Yin Ji Chang Fen", tooltip="Healthy & light"
-        ).add_to(m)
-        folium.Marker(
-            [37.70407465648592, -121.86595372989773], popup="Mayflower Restaurant", tooltip="Good Dimsum"
-        ).add_to(m)
-        folium.Marker(
-            [37.70528970455323, -121.8816482744688], popup="Cafe Tazza", tooltip="Authentic Indian"
-        ).add_to(m)
-        folium.Marker(
-            [37.677234124306, -121.89701156642151], popup="Sato Japanese Restaurant", tooltip="Authentic Japanese"
-        ).add_to(m)
-        # call to render Folium map in Streamlit
-        st_data = st_folium(m, width=350, height = 400)
+        # Nothing is read back from this map, so it's embedded as static HTML
+        # (rendered once per process) and panning never reruns the page.
+        static_map(restaurant_map_html(), width=350, height=400)
     st.write("")
     st.sidebar.markdown("##### Created by:")
     st.sidebar.markdown("# Chris Chen")
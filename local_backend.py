@@ -0,0 +1,141 @@
+import re
+import threading
+from datetime import date
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+
+# Mock-up People Analytics reference data.
+DIVISIONS = {
+    "Engineering": ["Platform", "Data Engineering", "Mobile", "QA"],
+    "Go-to-Market": ["Sales", "Marketing", "Customer Success"],
+    "Operations": ["Finance", "Human Resources", "Legal", "IT"],
+}
+EDUCATION = ["High School", "Associate", "Bachelor", "Master", "PhD"]
+EDUCATION_WEIGHTS = [0.1, 0.1, 0.45, 0.3, 0.05]
+JOB_NAMES = ["Analyst", "Engineer", "Senior Engineer", "Manager", "Director", "Specialist", "Coordinator"]
+
+# TPC-H nations: (N_NATIONKEY, N_NAME, N_REGIONKEY)
+NATIONS = [
+    (0, "ALGERIA", 0), (1, "ARGENTINA", 1), (2, "BRAZIL", 1), (3, "CANADA", 1), (4, "EGYPT", 4),
+    (5, "ETHIOPIA", 0), (6, "FRANCE", 3), (7, "GERMANY", 3), (8, "INDIA", 2), (9, "INDONESIA", 2),
+    (10, "IRAN", 4), (11, "IRAQ", 4), (12, "JAPAN", 2), (13, "JORDAN", 4), (14, "KENYA", 0),
+    (15, "MOROCCO", 0), (16, "MOZAMBIQUE", 0), (17, "PERU", 1), (18, "CHINA", 2), (19, "ROMANIA", 3),
+    (20, "SAUDI ARABIA", 4), (21, "VIETNAM", 2), (22, "RUSSIA", 3), (23, "UNITED KINGDOM", 3),
+    (24, "UNITED STATES", 1),
+]
+MARKET_SEGMENTS = ["AUTOMOBILE", "BUILDING", "FURNITURE", "HOUSEHOLD", "MACHINERY"]
+
+# Snowflake-only SQL used by the pages, rewritten to DuckDB equivalents.
+_DATEADD_DAY = re.compile(r"DATEADD\(\s*DAY\s*,\s*([^,()]+?)\s*,\s*([^,()]+?)\s*\)", re.IGNORECASE)
+
+
+def translate_sql(query):
+    return _DATEADD_DAY.sub(r"(\2 + to_days(CAST(\1 AS INTEGER)))", query)
+
+def people_tables(employees=2000, seed=0, as_of=date(2024, 3, 1)):
+    rng = np.random.default_rng(seed)
+    departments = pd.DataFrame(
+        [(department, division) for division, names in DIVISIONS.items() for department in names],
+        columns=["Department", "Division"],
+    )
+    as_of = np.datetime64(as_of, "D")
+    hired = as_of - rng.integers(0, 15 * 365, employees).astype("timedelta64[D]")
+    birth = hired - rng.integers(20 * 365, 45 * 365, employees).astype("timedelta64[D]")
+    employee_ids = np.arange(1, employees + 1)
+    employee = pd.DataFrame({
+        "EMPLOYEE_ID": employee_ids,
+        "NAME": [f"Employee {i}" for i in employee_ids],
+        "BIRTH_DATE": birth,
+        "Education": rng.choice(EDUCATION, employees, p=EDUCATION_WEIGHTS),
+        "HIRED_DATE": hired,
+        "JOB_NAME": rng.choice(JOB_NAMES, employees),
+        "DEPARTMENT_NAME": rng.choice(departments["Department"].to_numpy(), employees),
+    })
+    # Roughly a third of employees have left; the rest have no EMPLOYED_LENGTH row.
+    left = rng.random(employees) < 0.35
+    tenure = (as_of - hired[left]).astype(int)
+    employed_length = pd.DataFrame({
+        "EMPLOYEE_ID": employee_ids[left],
+        "EMPLOYED_LENGTH": (rng.random(left.sum()) * tenure).astype(int) + 1,
+        "IS_INVOLUNTARY_TERMINATION": rng.random(left.sum()) < 0.25,
+    })
+    return {"EMPLOYEE_TEST": employee, "DEPARTMENT_TEST": departments, "EMPLOYED_LENGTH_TEST": employed_length}
+
+def tpch_tables(customers=15000, seed=0):
+    rng = np.random.default_rng(seed)
+    nation = pd.DataFrame(NATIONS, columns=["N_NATIONKEY", "N_NAME", "N_REGIONKEY"])
+    nation["N_COMMENT"] = ""
+    keys = np.arange(1, customers + 1)
+    customer = pd.DataFrame({
+        "C_CUSTKEY": keys,
+        "C_NAME": [f"Customer#{k:09d}" for k in keys],
+        "C_ADDRESS": "",
+        "C_NATIONKEY": rng.integers(0, len(NATIONS), customers),
+        "C_PHONE": "",
+        # Same range as TPC-H: -999.99 to 9999.99.
+        "C_ACCTBAL": np.round(rng.uniform(-999.99, 9999.99, customers), 2),
+        "C_MKTSEGMENT": rng.choice(MARKET_SEGMENTS, customers),
+        "C_COMMENT": "",
+    })
+    return {"NATION": nation, "CUSTOMER": customer}
+
+def seed_database(conn, employees=2000, customers=15000, seed=0):
+    # People Analytics tables live under CCMOCKUP.PUBLIC like in Snowflake; the
+    # TPC-H tables sit in the default schema because the pages query them unqualified.
+    conn.execute("ATTACH ':memory:' AS CCMOCKUP")
+    conn.execute("CREATE SCHEMA CCMOCKUP.PUBLIC")
+    for name, df in people_tables(employees, seed).items():
+        conn.register("seed_df", df)
+        conn.execute(f"CREATE TABLE CCMOCKUP.PUBLIC.{name} AS SELECT * FROM seed_df")
+        conn.unregister("seed_df")
+    conn.execute("ALTER TABLE CCMOCKUP.PUBLIC.EMPLOYEE_TEST ALTER BIRTH_DATE TYPE DATE")
+    conn.execute("ALTER TABLE CCMOCKUP.PUBLIC.EMPLOYEE_TEST ALTER HIRED_DATE TYPE DATE")
+    for name, df in tpch_tables(customers, seed).items():
+        conn.register("seed_df", df)
+        conn.execute(f"CREATE TABLE {name} AS SELECT * FROM seed_df")
+        conn.unregister("seed_df")
+    conn.execute("ALTER TABLE CUSTOMER ALTER C_ACCTBAL TYPE DECIMAL(12, 2)")
+
+class DuckDBBackend:
+    """Embedded stand-in for Snowflake, seeded with the tables the pages query.
+
+    Result columns are upper-cased to match Snowflake's handling of unquoted
+    identifiers, so page code written against Snowflake runs unchanged.
+    """
+
+    name = "duckdb"
+    # Pushdown queries are written in Snowflake's dialect; callers compute
+    # aggregates locally from the full frame instead.
+    pushdown_aggregates = False
+
+    def __init__(self, employees=2000, customers=15000, seed=0):
+        self.target = f"duckdb://seed={seed}/employees={employees}/customers={customers}"
+        self._conn = duckdb.connect(":memory:")
+        self._lock = threading.Lock()
+        self._cursors = 0
+        seed_database(self._conn, employees, customers, seed)
+
+    def connect(self):
+        # DuckDB connections aren't safe to share across threads; each caller
+        # gets its own cursor onto the same database.
+        with self._lock:
+            self._cursors += 1
+            return self._conn.cursor()
+
+    def run_query(self, query):
+        with self.connect() as cur:
+            df = cur.execute(translate_sql(query)).df()
+        df.columns = [column.upper() for column in df.columns]
+        return df
+
+    def run_query_batches(self, query, batch_size=None):
+        with self.connect() as cur:
+            reader = cur.execute(translate_sql(query)).to_arrow_reader(batch_size or 1_000_000)
+            for batch in reader:
+                yield batch.rename_columns([column.upper() for column in batch.schema.names])
+
+    def stats(self):
+        return {"cursors": self._cursors}
@@ -0,0 +1,51 @@
+from functools import partial
+
+import streamlit as st
+import streamlit.components.v1 as components
+from streamlit_folium import st_folium
+
+
+# The only st_folium fields the pages read back. Anything else in
+# returned_objects (bounds, clicks, drawings, ...) posts back on every
+# interaction and reruns the script.
+VIEW_FIELDS = ["center", "zoom"]
+
+
+def render_html(fig):
+    # Standalone HTML document for a folium map; cache it per data/filter key.
+    return fig.get_root().render()
+
+def static_map(html, height, width=None):
+    """Embed pre-rendered map HTML. Pan and zoom stay in the browser and never rerun the script."""
+    if hasattr(st, "iframe"):
+        st.iframe(html, height=height, width=width or "stretch")
+    else:
+        # Streamlit releases before st.iframe.
+        components.html(html, height=height, width=width)
+
+def interactive_map(fig, key, height, width=None, center_key="map_center", zoom_key="map_zoom", tolerance=1e-4):
+    """st_folium embed that only reports the view, kept in session state.
+
+    The map is drawn at ``st.session_state[center_key]`` / ``[zoom_key]`` and
+    the figure itself doesn't depend on them, so a view change never rebuilds
+    the map. Only center and zoom are returned, so clicks and drawing don't
+    rerun the script; each pan or zoom still does. The latest view is always
+    kept (moves under ``tolerance`` degrees are ignored), so a full rerun
+    redraws the map where the user left it.
+    """
+    return st_folium(fig, key=key, height=height, width=width, returned_objects=VIEW_FIELDS,
+                     center=st.session_state.get(center_key), zoom=st.session_state.get(zoom_key),
+                     on_change=partial(_remember_view, key, center_key, zoom_key, tolerance))
+
+def _remember_view(key, center_key, zoom_key, tolerance):
+    view = st.session_state.get(key) or {}
+    center = view.get("center") or {}
+    zoom = view.get("zoom")
+    if "lat" not in center or zoom is None:
+        return
+    new_center = [center["lat"], center["lng"]]
+    old_center = st.session_state.get(center_key) or new_center
+    moved = max(abs(a - b) for a, b in zip(new_center, old_center)) > tolerance
+    if moved or zoom != st.session_state.get(zoom_key) or center_key not in st.session_state:
+        st.session_state[center_key] = new_center
+        st.session_state[zoom_key] = zoom
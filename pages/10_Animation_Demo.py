@@ -12,14 +12,53 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 from typing import Any
 
 import numpy as np
+from PIL import Image
 
 import streamlit as st
 from streamlit.hello.utils import show_code
 
 
+FRAMES = 100
+# Frames of this many slider settings stay cached (least recently used go first).
+CACHED_SETTINGS = 8
+
+
+@st.cache_resource
+def julia_grid(m: int = 960, n: int = 640, s: int = 400) -> Any:
+    # Flattened complex coordinate grid, built once per process and never mutated.
+    x = np.linspace(-m / s, m / s, num=m)
+    y = np.linspace(-n / s, n / s, num=n)
+    return (x[np.newaxis, :] + 1j * y[:, np.newaxis]).ravel(), (n, m)
+
+
+@st.cache_data(max_entries=FRAMES * CACHED_SETTINGS, show_spinner=False)
+def julia_frame(iterations: int, separation: float, frame_num: int, _counts: Any) -> bytes:
+    grid, shape = julia_grid()
+    c = separation * np.exp(1j * np.linspace(0.0, 4 * np.pi, FRAMES)[frame_num])
+
+    # Iterate only the pixels that haven't escaped: z and index hold the
+    # compacted active set and shrink as pixels leave it.
+    counts = _counts
+    counts.fill(0)
+    z = grid.copy()
+    index = np.arange(grid.size)
+    for i in range(iterations):
+        np.multiply(z, z, out=z)
+        z += c
+        active = z.real * z.real + z.imag * z.imag <= 4
+        z, index = z[active], index[active]
+        counts[index] = i
+
+    pixels = (255 * (1.0 - counts / max(counts.max(), 1))).astype(np.uint8).reshape(shape)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
 def animation_demo() -> None:
 
     # Interactive Streamlit elements, like these sliders, return their value.
@@ -36,29 +75,20 @@ def animation_demo() -> None:
     frame_text = st.sidebar.empty()
     image = st.empty()
 
-    m, n, s = 960, 640, 400
-    x = np.linspace(-m / s, m / s, num=m).reshape((1, m))
-    y = np.linspace(-n / s, n / s, num=n).reshape((n, 1))
+    # One iteration-count buffer for the whole animation.
+    counts = np.empty(julia_grid()[0].size)
 
-    for frame_num, a in enumerate(np.linspace(0.0, 4 * np.pi, 100)):
+    for frame_num in range(FRAMES):
         # Here were setting value for these two elements.
         progress_bar.progress(frame_num)
         frame_text.text("Frame %i/100" % (frame_num + 1))
 
-        # Performing some fractal wizardry.
-        c = separation * np.exp(1j * a)
-        Z = np.tile(x, (n, 1)) + 1j * np.tile(y, (1, m))
-        C = np.full((n, m), c)
-        M: Any = np.full((n, m), True, dtype=bool)
-        N = np.zeros((n, m))
-
-        for i in range(iterations):
-            Z[M] = Z[M] * Z[M] + C[M]
-            M[np.abs(Z) > 2] = False
-            N[M] = i
+        # Performing some fractal wizardry, or replaying the frame from the
+        # cache when these sliders were used before.
+        png = julia_frame(iterations, separation, frame_num, counts)
 
         # Update the image placeholder by calling the image() function on it.
-        image.image(1.0 - (N / N.max()), use_column_width=True)
+        image.image(png, use_container_width=True)
 
     # We clear elements by calling empty on them.
     progress_bar.empty()
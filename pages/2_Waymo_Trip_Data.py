@@ -1,22 +1,125 @@
 import streamlit as st
+import math
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import pandas as pd
 import altair as alt
-import requests
 from streamlit_pills import pills
-from google.oauth2 import service_account
-from google.cloud import bigquery
 from folium.plugins import HeatMap
 import folium
-from streamlit_folium import st_folium
 from streamlit_folium import folium_static
 
 # Utils imports
-from utils import run_query, init_connection  
+from utils import run_query, init_connection, get_query_cache, arrow_to_pandas
+from map_embed import interactive_map
+from trip_generation import GEN_AI_MODELS, MAX_TRIPS_PER_REQUEST, TripGenerator
+from waymo_trips import (BIGQUERY_TARGET, LOCAL_TRIP_CAPACITY, TABLE_SORT_COLUMNS, TRIP_LIMIT, RecentTrips, TripRollups,
+                         bin_coordinates, build_binned_trip_query, build_rollup_query, build_route_details_query,
+                         build_trip_query, page_of, search_trips,
+                         client_metrics, create_bigquery_client, create_bqstorage_client, heat_points, query_arrow)
 
 # Set Streamlit page configuration at the beginning
 st.set_page_config(page_title="Waymo Trip Data on Google Cloud", page_icon="🚗", layout="wide")
 
+# BigQuery clients built once per process and reused by every session and rerun;
+# only a cache miss in run_trip_query ever touches them.
+@st.cache_resource
+def get_bigquery_client():
+    return create_bigquery_client(dict(st.secrets["gcp_service_account"]))
+
+@st.cache_resource
+def get_bqstorage_client():
+    # None when google-cloud-bigquery-storage isn't installed (REST fallback).
+    return create_bqstorage_client(dict(st.secrets["gcp_service_account"]))
+
+# Latest trips per filter combination, held in memory per process and topped
+# up incrementally: after the first load only trips inserted since the newest
+# insert_timestamp seen are fetched. The full load stays an Arrow table end to
+# end (BigQuery -> disk cache -> memory) so restarts and replicas reuse it.
+@st.cache_resource(max_entries=32)
+def get_recent_trips(start_date, end_date, payment_method=None, gen_ai_model=None):
+    def fetch(inserted_since):
+        sql, job_config, cache_text = build_trip_query(start_date, end_date, payment_method, gen_ai_model,
+                                                       inserted_since=inserted_since)
+        def run():
+            return query_arrow(get_bigquery_client(), sql, bqstorage_client=get_bqstorage_client(), job_config=job_config)
+        if inserted_since is None:
+            return get_query_cache().get_or_run(cache_text, BIGQUERY_TARGET, run, ttl=300, as_arrow=True)
+        return run()
+    return RecentTrips(fetch)
+
+# Every trip (up to LOCAL_TRIP_CAPACITY) in one buffer shared by all sessions;
+# while it holds them all, filter changes are answered from its TripIndex
+# without a BigQuery round trip.
+@st.cache_resource
+def get_trip_store():
+    def fetch(inserted_since):
+        sql, job_config, _ = build_trip_query(None, None, limit=LOCAL_TRIP_CAPACITY + 1, inserted_since=inserted_since)
+        return query_arrow(get_bigquery_client(), sql, bqstorage_client=get_bqstorage_client(), job_config=job_config)
+    return RecentTrips(fetch, capacity=LOCAL_TRIP_CAPACITY)
+
+# New trips are picked up at most every 5 min.
+def run_trip_query(start_date, end_date, payment_method=None, gen_ai_model=None):
+    store = get_trip_store()
+    store.refresh_if_stale(300)
+    if store.complete:
+        return store.index.select(start_date, end_date, payment_method, gen_ai_model, limit=TRIP_LIMIT)
+    # Too many trips to hold in memory: filter in BigQuery instead.
+    recent = get_recent_trips(start_date, end_date, payment_method, gen_ai_model)
+    recent.refresh_if_stale(300)
+    return recent.table
+
+# One pooled HTTP session and worker pool for trip generation, shared by all sessions.
+@st.cache_resource
+def get_trip_generator():
+    return TripGenerator()
+
+# Hourly rollups per model and payment method, shared by all sessions and
+# topped up with only the newest hours.
+@st.cache_resource
+def get_trip_rollups():
+    def fetch(inserted_since):
+        sql, job_config, _ = build_rollup_query(inserted_since)
+        return query_arrow(get_bigquery_client(), sql, bqstorage_client=get_bqstorage_client(), job_config=job_config)
+    return TripRollups(fetch)
+
+# Changes whenever the trips behind the filters are reloaded or topped up.
+def trip_data_version(filters):
+    store = get_trip_store()
+    source = store if store.complete else get_recent_trips(*filters)
+    return source.loaded_at.isoformat(), str(source.watermark)
+
+# Route details for one trip, fetched only when its row is selected in the table.
+@st.cache_data(ttl=3600, max_entries=256)
+def load_route_details(trip_id, trip_date):
+    sql, job_config, _ = build_route_details_query(trip_id, trip_date)
+    table = query_arrow(get_bigquery_client(), sql, job_config=job_config)
+    return table["route_details"][0].as_py() if table.num_rows else None
+
+# Heat map cells for every matching trip, aggregated in BigQuery.
+@st.cache_data(ttl=300)
+def run_binned_trip_query(start_date, end_date, payment_method=None, gen_ai_model=None, include_end=False):
+    sql, job_config, cache_text = build_binned_trip_query(start_date, end_date, payment_method, gen_ai_model,
+                                                          include_end=include_end)
+    def fetch():
+        return query_arrow(get_bigquery_client(), sql, bqstorage_client=get_bqstorage_client(), job_config=job_config)
+    return get_query_cache().get_or_run(cache_text, BIGQUERY_TARGET, fetch, ttl=300, as_arrow=True)
+
+# Wall time of the last rerun of each part of the page, per session. Fragment
+# reruns update only their own entry.
+@contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = st.session_state.setdefault("rerun_timings", {}).setdefault(name, {"runs": 0, "last_ms": 0.0, "total_ms": 0.0})
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        timing["runs"] += 1
+        timing["last_ms"] = round(elapsed_ms, 1)
+        timing["total_ms"] = round(timing["total_ms"] + elapsed_ms, 1)
+
 def main():
     st.title("Waymo Trip Data on Google Cloud 🚗")
     # Sidebar
@@ -24,69 +127,84 @@ def main():
 
     # Tabs
     # tab_about, tab_main, tab_to_dos = st.tabs(["About"])
-    tab_about, tab_generate_data, tab_heatmap = st.tabs(["About","OpenAI vs. Gemini", "Heat Map"])
-
-    with tab_generate_data:
-        topic = pills(
-        "",
-        [
-            "AI Generate Data",
-            "Data Definition"
-        #     "Recruitment",
-        #     "Demographics",
-        #     "Dataframe"
-        ],
-        [
-            "🚘",
-            "📄"
-        #     "💼",
-        #     "🧑",
-        #     "📃"
-        ]
-        # label_visibility="collapsed"
-        )
+    # Switching tabs reruns the page, and only the open tab's body is computed.
+    tab_about, tab_generate_data, tab_heatmap = st.tabs(["About","OpenAI vs. Gemini", "Heat Map"], on_change="rerun",
+                                                        key="waymo_tab")
+
+    if tab_generate_data.open:
+        with tab_generate_data, timed("OpenAI vs. Gemini tab"):
+            topic = pills(
+            "",
+            [
+                "AI Generate Data",
+                "Model Comparison",
+                "Data Definition"
+            #     "Recruitment",
+            #     "Demographics",
+            #     "Dataframe"
+            ],
+            [
+                "🚘",
+                "📊",
+                "📄"
+            #     "💼",
+            #     "🧑",
+            #     "📃"
+            ]
+            # label_visibility="collapsed"
+            )
         
-        if topic == "AI Generate Data":
-            show_form()
-        elif topic == "Data Definition":
-            show_data_definition()
+            if topic == "AI Generate Data":
+                show_form()
+            elif topic == "Model Comparison":
+                show_model_comparison()
+            elif topic == "Data Definition":
+                show_data_definition()
     tableau_url = "https://public.tableau.com/app/profile/chrischen.analytics/viz/WaymoMock-upTripData/Dashboard1"
-    with tab_about:
-        st.write("While exploring a career opportunity at Waymo, I envisioned what their data ecosystem might look like and decided to create a demo to bring this idea to life. As a data professional, I leveraged my expertise to experiment with various cloud technologies. Currently, I am developing a self-serve BI application using :orange[**Google Cloud Platform**] to showcase my skills and understanding. ")
-        st.write("")                 
-        st.write("The data pipeline is designed to ingest and store data in :orange[**BigQuery**] for reporting and analysis. ")
-        st.write("")  
-        st.write("To simulate trip data, I use my :orange[**OpenAI API**] account to generate Waymo trips in San Francisco.  The generation pipeline is scheduled to run once every hour on :orange[**Cloud Run Function**]. Then the stream of data is ingested into a :orange[**BigQuery**] table. Finally, I leverage :orange[**Streamlit**]  to develop a self-service BI application for analyzing and visualizing the data. ")
-        st.write("")
-        st.write("There are many ways to implement this, but I chose this particular design to keep things interesting while maintaining a low cost profile.  One thing I've learned from using cloud technologies is that while they are very convenient, your wallet can quickly get burned if you don't choose wisely. The rule of thumb is to :orange[**use only what you need**] but keep it :orange[**flexible**] and :orange[**scalable**]. You can then quickly scale up if needed. ")
-        st.write("")
-        st.write("Later, I decided to compare OpenAI and :orange[**Google Gemini**] and see how they differ in generating the mock-up data and in terms of costs.  ")
-        st.write("")
-        st.write("Some people commented and said I should visualize the data in :orange[**Tableau**].  So I use a :orange[**Cloud Composer**] to query BigQuery data, export to :orange[**Google Sheet**] to support the [Tableau dashboard](%s).  It refreshes daily.  " % tableau_url)
-        st.write("")
-        st.write("I just got inspired with an idea to train a :orange[**GenAI model**] against the mock-up data to answer BI questions.  ")
-        st.write("---")
-
-        st.subheader("📖 Resources")
-        st.markdown(
-            """
-        - OpenAI
-            - [OpenAI Playground](https://beta.openai.com/playground)
-            - [OpenAI Documentation](https://beta.openai.com/docs)    
-        - Streamlit
-            - [Documentation](https://docs.streamlit.io/)
-            - [Gallery](https://streamlit.io/gallery)
-            - [Cheat sheet](https://docs.streamlit.io/library/cheatsheet)
-            - [Book](https://www.amazon.com/dp/180056550X) (Getting Started with Streamlit for Data Science)
-            - Deploy your apps using [Streamlit Community Cloud](https://streamlit.io/cloud) in just a few clicks 
-        """)
-
-    with tab_heatmap:
-        show_heatmap()
+    if tab_about.open:
+        with tab_about, timed("About tab"):
+            st.write("While exploring a career opportunity at Waymo, I envisioned what their data ecosystem might look like and decided to create a demo to bring this idea to life. As a data professional, I leveraged my expertise to experiment with various cloud technologies. Currently, I am developing a self-serve BI application using :orange[**Google Cloud Platform**] to showcase my skills and understanding. ")
+            st.write("")                 
+            st.write("The data pipeline is designed to ingest and store data in :orange[**BigQuery**] for reporting and analysis. ")
+            st.write("")  
+            st.write("To simulate trip data, I use my :orange[**OpenAI API**] account to generate Waymo trips in San Francisco.  The generation pipeline is scheduled to run once every hour on :orange[**Cloud Run Function**]. Then the stream of data is ingested into a :orange[**BigQuery**] table. Finally, I leverage :orange[**Streamlit**]  to develop a self-service BI application for analyzing and visualizing the data. ")
+            st.write("")
+            st.write("There are many ways to implement this, but I chose this particular design to keep things interesting while maintaining a low cost profile.  One thing I've learned from using cloud technologies is that while they are very convenient, your wallet can quickly get burned if you don't choose wisely. The rule of thumb is to :orange[**use only what you need**] but keep it :orange[**flexible**] and :orange[**scalable**]. You can then quickly scale up if needed. ")
+            st.write("")
+            st.write("Later, I decided to compare OpenAI and :orange[**Google Gemini**] and see how they differ in generating the mock-up data and in terms of costs.  ")
+            st.write("")
+            st.write("Some people commented and said I should visualize the data in :orange[**Tableau**].  So I use a :orange[**Cloud Composer**] to query BigQuery data, export to :orange[**Google Sheet**] to support the [Tableau dashboard](%s).  It refreshes daily.  " % tableau_url)
+            st.write("")
+            st.write("I just got inspired with an idea to train a :orange[**GenAI model**] against the mock-up data to answer BI questions.  ")
+            st.write("---")
+
+            st.subheader("📖 Resources")
+            st.markdown(
+                """
+            - OpenAI
+                - [OpenAI Playground](https://beta.openai.com/playground)
+                - [OpenAI Documentation](https://beta.openai.com/docs)    
+            - Streamlit
+                - [Documentation](https://docs.streamlit.io/)
+                - [Gallery](https://streamlit.io/gallery)
+                - [Cheat sheet](https://docs.streamlit.io/library/cheatsheet)
+                - [Book](https://www.amazon.com/dp/180056550X) (Getting Started with Streamlit for Data Science)
+                - Deploy your apps using [Streamlit Community Cloud](https://streamlit.io/cloud) in just a few clicks 
+            """)
+
+    if tab_heatmap.open:
+        with tab_heatmap, timed("Heat Map tab"):
+            show_heatmap()
+
+    with st.sidebar.expander("Rerun timings"):
+        st.json(st.session_state.get("rerun_timings", {}))
 
 def show_form():
     form_layout()
 
+def show_model_comparison():
+    model_comparison_layout()
+
 def show_data_definition():
     data_definition_layout()
 
@@ -105,12 +223,12 @@ def form_layout():
         col1, col2, col3 = st.columns(3, gap="small")
 
         with col1:
-            trip_count = st.number_input("Number of Trips", value=1, min_value=1, max_value=10, help="The maximum number of trip to generate is 10 per request.")
+            trip_count = st.number_input("Number of Trips", value=1, min_value=1, max_value=100, help=f"Requests are sent in concurrent batches of up to {MAX_TRIPS_PER_REQUEST} trips.")
             prompt_hint = st.text_input("Trip location hint (Optional):", help="Enter hint of locations for the trips.")
 
         with col2:
             trip_date = st.date_input("Trip Date", help="Date of the generated trip.")
-            gen_ai_model = st.radio("Gen AI Model to Use", ["OpenAI gpt-3.5-turbo-instruct","gemini-1.5-flash-002"],help="Gen AI model for mock-up data generation.")
+            gen_ai_model = st.radio("Gen AI Model to Use", list(GEN_AI_MODELS), format_func=GEN_AI_MODELS.get, help="Gen AI model for mock-up data generation.")
 
 
         # col1, col2 = st.columns(2, gap="medium")
@@ -119,57 +237,79 @@ def form_layout():
         
         # submitted = st.form_submit_button("Generate Trip Data! ✨")
         if st.form_submit_button("Generate Trip Data! ✨"):
-            # Prepare the data payload
-            payload = {
-                "trip_count": trip_count,
-                "trip_date": str(trip_date),
-                "prompt_hint": prompt_hint,
-                "gen_ai_model": gen_ai_model
-            }
-
-            try:
-                url = "https://us-west1-waymo-sandbox.cloudfunctions.net/gen-waymo-trip-data"
-                # Send the POST request
-                response = requests.post(url, json=payload)
-                
-                # Display the response
-                if response.status_code == 200:
-                    st.success("Request was successful!")
-                    # st.json(response.json())  # Display JSON response
-                else:
-                    st.error(f"Request failed with status code {response.status_code}: {response.text}")
-            except Exception as e:
-                st.error(f"An error occurred: {e}")
+            # Submitted in the background; progress is polled below.
+            job = get_trip_generator().submit(trip_count, trip_date, prompt_hint, gen_ai_model)
+            jobs = st.session_state.setdefault("generation_jobs", [])
+            jobs.insert(0, job)
+            del jobs[20:]
+
+    generation_jobs_fragment()
+
+# Polls once a second while this session has a job running.
+def generation_jobs_fragment():
+    jobs = st.session_state.get("generation_jobs", [])
+    running = any(not job.done for job in jobs)
+
+    @st.fragment(run_every=1 if running else None)
+    def show_jobs():
+        for job in st.session_state.get("generation_jobs", [])[:5]:
+            status = job.snapshot()
+            label = f"{status['gen_ai_model']}: {status['trips_generated']}/{status['trips_requested']} trips"
+            if not job.done:
+                st.progress(status["progress"], text=f"{label} ({status['batches_done']}/{status['batches']} batches)")
+            elif status["errors"]:
+                st.error(f"{label} in {status['seconds']:.1f}s. {len(status['errors'])} batch(es) failed: {status['errors'][0]}")
+            else:
+                st.success(f"{label} in {status['seconds']:.1f}s.")
+        if running and all(job.done for job in st.session_state.get("generation_jobs", [])):
+            # Stop polling.
+            st.rerun()
+        with st.expander("Generation throughput by model"):
+            st.json(get_trip_generator().stats())
+
+    show_jobs()
+
+def model_comparison_layout():
+    st.write("Generated trips compared by Gen AI model, read from hourly rollups that pick up new trips every 5 minutes.")
+    rollups = get_trip_rollups()
+    rollups.refresh_if_stale(300)
+    granularity = st.radio("Granularity", ["Hourly", "Daily", "Weekly"], index=1, horizontal=True)
+    by_period = rollups.rollup(["gen_ai_model"], {"Hourly": "h", "Daily": "D", "Weekly": "W"}[granularity])
+
+    summary = rollups.rollup(["gen_ai_model"]).set_index("gen_ai_model")
+    # Generation latency isn't stored with the trips; it comes from the jobs
+    # submitted from this app, keyed by the same gen_ai_model values.
+    latency = get_trip_generator().stats()
+    summary["mean_latency_seconds"] = [latency.get(model, {}).get("mean_latency_seconds") for model in summary.index]
+    summary["trips_per_second"] = [latency.get(model, {}).get("trips_per_second") for model in summary.index]
+    st.dataframe(summary[["trips", "mean_distance_miles", "mean_trip_duration", "mean_payment_amount",
+                          "mean_latency_seconds", "trips_per_second"]], use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.altair_chart(alt.Chart(by_period).mark_line(point=True).encode(
+            x=alt.X("period:T", title=granularity),
+            y=alt.Y("trips:Q", title="Trips"),
+            color="gen_ai_model:N",
+        ).properties(title="Trips generated"), use_container_width=True)
+    with col2:
+        metric = st.selectbox("Metric", ["mean_payment_amount", "mean_distance_miles", "mean_trip_duration"])
+        st.altair_chart(alt.Chart(by_period).mark_line(point=True).encode(
+            x=alt.X("period:T", title=granularity),
+            y=alt.Y(f"{metric}:Q", title=metric.replace("_", " ").capitalize()),
+            color="gen_ai_model:N",
+        ), use_container_width=True)
+    by_payment = rollups.rollup(["gen_ai_model", "payment_method"])
+    st.altair_chart(alt.Chart(by_payment).mark_bar().encode(
+        x=alt.X("trips:Q", title="Trips"),
+        y=alt.Y("gen_ai_model:N", title=None),
+        color="payment_method:N",
+    ).properties(title="Payment method"), use_container_width=True)
+    last = rollups.last_refresh
+    st.caption(f"Rollup: {len(rollups.hourly)} hourly rows. Last refresh: {last['mode']}, "
+               f"{last['rows_fetched']} rows fetched in {last['seconds']:.2f}s.")
 
 def heatmap_layout():
-    # Create API client.
-    credentials = service_account.Credentials.from_service_account_info(
-        st.secrets["gcp_service_account"]
-    )
-    # Initialize BigQuery client
-    client = bigquery.Client(credentials=credentials)
-    # Define your table ID
-    table_id = "waymo-sandbox.waymo_mockup.trip_data"
-
-    # Query the BigQuery table
-    query = f"SELECT * FROM `{table_id}` order by insert_timestamp desc limit 5000"
-
-    # Perform query.
-    # Uses st.cache_data to only rerun when the query changes or after 5 min.
-    # st.write("Uses st.cache_data to only rerun when the query changes or after 5 min.")
-    @st.cache_data(ttl=300)
-    def run_query(query):
-        query_job = client.query(query)
-        rows_raw = query_job.result()
-        # Convert to list of dicts. Required for st.cache_data to hash the return value.
-        rows = [dict(row) for row in rows_raw]
-        return rows
-    
-    # Load the query result into a Pandas DataFrame
-    # df = client.query(query).to_dataframe()
-    df = pd.DataFrame(run_query(query))
-    df["trip_date"] = pd.to_datetime(df["trip_date"]) # Convert to datetime
-    
     col1, col2 = st.columns([3,1])
     # Initialize session state for map visibility
     if "map_center" not in st.session_state:
@@ -180,110 +320,105 @@ def heatmap_layout():
     if "show_map" not in st.session_state:
         st.session_state.show_map = True
 
+    # Filter changes rerun the whole (visible) tab; the map and the data table
+    # are fragments, so their own buttons and map interactions rerun only
+    # themselves.
     with col2:
         start_date = st.date_input("Start Date",datetime.strptime("2024-05-01", '%Y-%m-%d').date() )
         end_date = st.date_input("End Date", datetime.today())
         payment_method = st.radio("Payment Method", ["Any", "credit card", "in-app billing"], index=0)
         genai_model = st.radio("GenAI Model", ["gpt-3.5-turbo-instruct", "gemini-1.5-flash-002"], index=0)
-    
-    filtered_df = df
-
-    if start_date and end_date:
-        start_date = pd.to_datetime(start_date)
-        end_date = pd.to_datetime(end_date)
-        filtered_df = filtered_df[(filtered_df['trip_date'] >= start_date) & (filtered_df['trip_date'] <= end_date)]
-    
-    if payment_method in ["credit card", "in-app billing"]:
-        filtered_df = filtered_df[filtered_df['payment_method'] == payment_method]
-
-    if genai_model in ["OpenAI gpt-3.5-turbo-instruct", "gemini-1.5-flash-002"]:
-        filtered_df = filtered_df[filtered_df['gen_ai_model'] == genai_model]
-
-    clist = filtered_df[["start_latitude", "start_longitude"]].values.tolist()    
-    
+        heat_source = st.radio("Heat Map Of", [f"Last {TRIP_LIMIT} trips", "All trips (binned)"], index=0,
+                               help="All trips are counted per grid cell in BigQuery, so the map stays small at any trip count.")
+        include_end = st.checkbox("Include end locations")
+
+    # Filters are answered from the in-memory trip index (or in BigQuery when
+    # there are too many trips to hold), so the 5000-row limit applies after filtering.
+    filters = (
+        start_date or datetime.strptime("2024-05-01", '%Y-%m-%d').date(),
+        end_date or datetime.today().date(),
+        payment_method if payment_method != "Any" else None,
+        genai_model,
+    )
 
     with col1:
-        st.write("Click the button to toggle :orange[**Heat map**] of the last 5000 trip starting locations.")
+        heatmap_fragment(filters, heat_source, include_end)
+        trip_table_fragment(filters, include_end)
+
+@st.fragment
+def heatmap_fragment(filters, heat_source, include_end):
+    with timed("Heat map"):
+        st.write(f"Click the button to toggle :orange[**Heat map**] of trip locations matching the filters ({heat_source.lower()}).")
         # Button to toggle map visibility
         if st.button("Toggle Heat Map"):
             st.session_state.show_map = not st.session_state.show_map
-            # st.session_state.map_center = [37.76, -122.41]  # Default center
-            # st.session_state.map_zoom = 12  # Default zoom
-        if st.session_state.show_map:
-            # San Francisco base map
-            with st.container(height = 510):
-                m = folium.Map(location=st.session_state.map_center, zoom_start=st.session_state.map_zoom)
-                HeatMap(clist).add_to(m)   
-                # # Add a JavaScript listener to capture map zoom and center
-                # capture_js = """
-                # <script>
-                #     function captureMapState(map) {
-                #         map.on('zoomend', function() {
-                #             const zoomLevel = map.getZoom();
-                #             const center = map.getCenter();
-                #             const state = JSON.stringify({ zoom: zoomLevel, center: center });
-                #             document.getElementById('map_state').value = state;
-                #             document.getElementById('map_state').dispatchEvent(new Event('change'));
-                #         });
-                #         map.on('moveend', function() {
-                #             const zoomLevel = map.getZoom();
-                #             const center = map.getCenter();
-                #             const state = JSON.stringify({ zoom: zoomLevel, center: center });
-                #             document.getElementById('map_state').value = state;
-                #             document.getElementById('map_state').dispatchEvent(new Event('change'));
-                #         });
-                #     }
-                #     setTimeout(() => {
-                #         if (window.map) {
-                #             captureMapState(window.map);
-                #         }
-                #     }, 500);
-                # </script>
-                # <input type="hidden" id="map_state" name="map_state" value="">
-                # """
-                # # Add the custom JavaScript to the map
-                # m.get_root().html.add_child(folium.Element(capture_js))
-                st_data = st_folium(m, width=800, height = 480)
-            # st_data = folium_static(m, width=800, height 
-                # st.session_state.map_zoom = st_data.get("zoom")
-                # cdata = st_data.get("center")
-                # if cdata:
-                    # st.session_state.map_center = [cdata["lat"],cdata["lng"]] 
-                # Update session state based on user interaction
-                # if st_data:
-                #     # st.write("Raw map_data:", st_data)
-                #     cdata = st_data.get("center")
-                #     if cdata:
-                #         updated_center = [st_data["center"]["lat"], st_data["center"]["lng"]]
-                #         if updated_center != st.session_state.map_center:
-                #             st.session_state.map_center = updated_center
-                #             # st.experimental_rerun() 
-                #     zdata = st_data.get("zoom")
-                #     if zdata:
-                #         updated_zoom = st_data["zoom"]
-                #         if (updated_zoom != st.session_state.map_zoom):
-                #             st.session_state.map_zoom = updated_zoom
-                            # st.experimental_rerun() 
-
-                # # Display the captured map state
-                # st.write("Map Center:", st.session_state.map_center)
-                # st.write("Zoom Level:", st.session_state.map_zoom)
-        # Add a session state variable to track refresh requests
-        if "refresh" not in st.session_state:
-            st.session_state.refresh = False
-
-        # If refresh is triggered, clear the cache and reset the flag
-        if st.session_state.refresh:
-            run_query.clear()
-            st.session_state.refresh = False  # Reset the flag 
-        st.write("Data: (query results cached with 5 minutes timeout)")
+        if not st.session_state.show_map:
+            return
+        run_trip_query(*filters)  # picks up new trips at most every 5 min
+        clist = heatmap_points(trip_data_version(filters), filters, heat_source, include_end)
+        # San Francisco base map. The view isn't part of the figure, so panning
+        # and zooming never rebuild it; only center/zoom come back from the browser.
+        with st.container(height = 510):
+            m = folium.Map(location=[37.76, -122.41], zoom_start=12)
+            HeatMap(clist).add_to(m)
+            interactive_map(m, key="heatmap", width=800, height=480)
+
+# Heat map points per (data version, filters), shared by every session.
+@st.cache_data(max_entries=32)
+def heatmap_points(data_version, filters, heat_source, include_end):
+    # Weighted grid cells instead of one point per trip keep the map payload bounded.
+    if heat_source == "All trips (binned)":
+        cells = arrow_to_pandas(run_binned_trip_query(*filters, include_end=include_end))
+    else:
+        trips = arrow_to_pandas(run_trip_query(*filters))
+        if include_end:
+            cells = bin_coordinates(pd.concat([trips["start_latitude"], trips["end_latitude"]]),
+                                    pd.concat([trips["start_longitude"], trips["end_longitude"]]))
+        else:
+            cells = bin_coordinates(trips["start_latitude"], trips["start_longitude"])
+    return heat_points(cells)
+
+@st.fragment
+def trip_table_fragment(filters, include_end):
+    with timed("Trip table"):
+        st.write("Data: (new trips fetched at most every 5 minutes)")
         if st.button("Force Refresh"):
-            st.session_state.refresh = True  # Set the flag to trigger a rerun
-        st.dataframe(filtered_df)
-    # with col2:
-    #     zoom_level = st.text_input("Zoom level", value=st_data.get("zoom"))
-        
-    
+            # Only trips inserted since the last refresh are fetched.
+            store = get_trip_store()
+            store.refresh()
+            if not store.complete:
+                get_recent_trips(*filters).refresh()
+            run_binned_trip_query.clear()
+            heatmap_points.clear()
+            get_query_cache().invalidate(build_binned_trip_query(*filters, include_end=include_end)[2], BIGQUERY_TARGET)
+            # The map shows the same trips, so rerun the whole tab.
+            st.rerun()
+        # Search, sort and paging run here on the Arrow table; only the visible
+        # page is converted and sent to the browser.
+        search_col, sort_col, order_col, size_col = st.columns([2, 2, 1, 1])
+        search = search_col.text_input("Search", placeholder="trip id, vehicle, payment method or model")
+        sort_by = sort_col.selectbox("Sort by", TABLE_SORT_COLUMNS)
+        descending = order_col.toggle("Descending", value=True)
+        page_size = size_col.selectbox("Rows per page", [25, 50, 100])
+        trips = search_trips(run_trip_query(*filters), search)
+        pages = max(1, math.ceil(trips.num_rows / page_size))
+        page = st.number_input(f"Page (of {pages}, {trips.num_rows} trips)", min_value=1, max_value=pages, value=1)
+        page_df = arrow_to_pandas(page_of(trips, page, page_size, sort_by, descending))
+        event = st.dataframe(page_df, hide_index=True, on_select="rerun", selection_mode="single-row")
+        if event.selection.rows:
+            trip = page_df.iloc[event.selection.rows[0]]
+            st.text_area(f"Route details for trip {trip['trip_id']}",
+                         load_route_details(trip["trip_id"], trip["trip_date"]) or "", disabled=True)
+        else:
+            st.caption("Select a row to load its route details.")
+        with st.expander("Trip cache"):
+            store = get_trip_store()
+            if store.complete:
+                st.json({**store.stats(), "index": store.index.stats()})
+            else:
+                st.json(get_recent_trips(*filters).stats())
+        with st.expander("BigQuery client"):
+            st.json(client_metrics())
 
 def data_definition_layout():
     # str = '<table><thead><tr><th ><p><span><strong><span>Column name</span></strong></span></p></th><th><p><span><strong><span>Description</span></strong></span></p></th></tr></thead><tbody><tr><td><p data-text-variant="body1"><span><span>ID</span></span></p></td><td><p data-text-variant="body1"><span><span>Trip identification number</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>VendorID</span></span></p></td><td><p data-text-variant="body1"><span><span>A code indicating the TPEP provider that provided the record.&nbsp; </span></span></p><p data-text-variant="body1"><span><strong><span>1= Creative Mobile Technologies, LLC; </span></strong></span></p><p data-text-variant="body1"><span><strong><span>2= VeriFone Inc.</span></strong></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>tpep_pickup_datetime&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The date and time when the meter was engaged.&nbsp;</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>tpep_dropoff_datetime&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The date and time when the meter was disengaged.&nbsp;</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Passenger_count&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The number of passengers in the vehicle.&nbsp;&nbsp;</span></span></p><p data-text-variant="body1"><span><span>This is a driver-entered value.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Trip_distance&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The elapsed trip distance in miles reported by the taximeter.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>PULocationID&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>TLC Taxi Zone in which the taximeter was engaged</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>DOLocationID&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>TLC Taxi Zone in which the taximeter was disengaged</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>RateCodeID&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The final rate code in effect at the end of the trip.&nbsp;</span></span></p><p data-text-variant="body1"><span><strong><span>1= Standard rate&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>2=JFK&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>3=Newark&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>4=Nassau or Westchester&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>5=Negotiated fare&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>6=Group ride</span></strong></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Store_and_fwd_flag&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>This flag indicates whether the trip record was held in vehicle memory before being sent to the vendor, aka “store and forward,”&nbsp; because the vehicle did not have a connection to the server.&nbsp;</span></span></p><p data-text-variant="body1"><span><strong><span>Y= store and forward trip&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>N= not a store and forward trip</span></strong></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Payment_type&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>A numeric code signifying how the passenger paid for the trip.&nbsp; </span></span></p><p data-text-variant="body1"><span><strong><span>1= Credit card&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>2= Cash&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>3= No charge&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>4= Dispute&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>5= Unknown&nbsp;</span></strong></span></p><p data-text-variant="body1"><span><strong><span>6= Voided trip</span></strong></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Fare_amount&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The time-and-distance fare calculated by the meter.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Extra&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>Miscellaneous extras and surcharges. Currently, this only includes the $0.50 and $1 rush hour and overnight charges.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>MTA_tax&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>$0.50 MTA tax that is automatically triggered based on the metered rate in use.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Improvement_surcharge&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>$0.30 improvement surcharge assessed trips at the flag drop. The&nbsp; improvement surcharge began being levied in 2015.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Tip_amount&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>Tip amount – This field is automatically populated for credit card tips. Cash tips are not included.</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Tolls_amount&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>Total amount of all tolls paid in trip.&nbsp;</span></span></p></td></tr><tr><td><p data-text-variant="body1"><span><span>Total_amount&nbsp;</span></span></p></td><td><p data-text-variant="body1"><span><span>The total amount charged to passengers. Does not include cash tips.</span></span></p></td></tr></tbody></table>'
@@ -1,26 +1,61 @@
 import streamlit as st
 from datetime import datetime
-import pandas as pd
-import altair as alt
 from streamlit_pills import pills
 
 # Utils imports
-from utils import run_query, init_connection  
+from utils import run_query, init_connection, get_backend, get_config
+from people_analytics import (PEOPLE_QUERY, PEOPLE_AGGREGATES_QUERY, GRANULARITIES, HeadcountCube, PeopleDataset,
+                              headcount_over_time, prepare_people_frame, resample_headcount)
 
 # Set Streamlit page configuration at the beginning
 st.set_page_config(page_title="People Analytics Demo ", page_icon="🧑", layout="wide")
 
-# Decorator for caching data loading function
-@st.cache_data
+# Decorator for caching data loading function. Cached as a shared resource (no
+# copy per rerun), so the frame is read-only; derived columns are added here.
+@st.cache_resource(ttl=24 * 3600)
 def load_people_data():
     # query = "SELECT A.EMPLOYEE_ID, A.NAME, A.BIRTH_DATE, A.\"Education\" as EDUCATION, A.HIRED_DATE, A.JOB_NAME, A.DEPARTMENT_NAME, B.\"Division\" as DIVISION_NAME from CCMOCKUP.PUBLIC.EMPLOYEE_TEST A join CCMOCKUP.PUBLIC.DEPARTMENT_TEST B on A.DEPARTMENT_NAME = B.\"Department\""
-    query = "SELECT A.EMPLOYEE_ID, A.NAME, A.BIRTH_DATE, A.\"Education\" as EDUCATION, A.HIRED_DATE, A.JOB_NAME, A.DEPARTMENT_NAME, B.\"Division\" as DIVISION_NAME, DATEADD(DAY, C.EMPLOYED_LENGTH, A.HIRED_DATE) as END_DATE, C.IS_INVOLUNTARY_TERMINATION from CCMOCKUP.PUBLIC.EMPLOYEE_TEST A join CCMOCKUP.PUBLIC.DEPARTMENT_TEST B on A.DEPARTMENT_NAME = B.\"Department\" left join CCMOCKUP.PUBLIC.EMPLOYED_LENGTH_TEST C on A.EMPLOYEE_ID = C.EMPLOYEE_ID"
-    return run_query(query)
-
-def calculate_age(birth_date):
-    today = datetime.now()
-    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    return age
+    query = PEOPLE_QUERY
+    # Also persisted on disk for a day so restarts and other replicas skip Snowflake.
+    return prepare_people_frame(run_query(query, ttl=24 * 3600))
+
+# Cube behind the Headcount, Recruitment and Demographics pills. Built once and
+# shared as a resource (no per-rerun copy); with Snowflake the aggregation runs
+# as one GROUPING SETS query so only the cube cells are shipped.
+@st.cache_resource(ttl=24 * 3600)
+def load_headcount_cube():
+    version = datetime.now()
+    if get_backend().pushdown_aggregates:
+        return HeadcountCube.from_aggregates(run_query(PEOPLE_AGGREGATES_QUERY, ttl=24 * 3600), version)
+    return HeadcountCube.from_frame(load_people_data(), version)
+
+# [people_analytics] refresh = "incremental" keeps one PeopleDataset per process
+# that only pulls rows hired or terminated since its last refresh.
+PEOPLE_OPTIONS = get_config("people_analytics")
+INCREMENTAL_REFRESH = PEOPLE_OPTIONS.get("refresh") == "incremental"
+
+@st.cache_resource
+def load_people_dataset():
+    return PeopleDataset(
+        run_query,
+        lookback_days=PEOPLE_OPTIONS.get("lookback_days", 30),
+        full_refresh_seconds=PEOPLE_OPTIONS.get("full_refresh_seconds", 24 * 3600)
+    )
+
+def current_people_dataset():
+    dataset = load_people_dataset()
+    dataset.refresh_if_stale(PEOPLE_OPTIONS.get("refresh_seconds", 600))
+    return dataset
+
+def people_data():
+    return current_people_dataset().frame if INCREMENTAL_REFRESH else load_people_data()
+
+def headcount_cube():
+    return current_people_dataset().cube if INCREMENTAL_REFRESH else load_headcount_cube()
+
+def daily_headcount():
+    # None means trend_layout computes it from the frame.
+    return current_people_dataset().daily_headcount if INCREMENTAL_REFRESH else None
 
 def main():
     st.title("People Analytics Demo 🧑")
@@ -49,17 +84,17 @@ def main():
         ]
         # label_visibility="collapsed"
         )
-        df = load_people_data()
+        # Only Trend and Dataframe need every employee row.
         if topic == "Trend":
-            show_trend(df)
+            show_trend(people_data(), daily_headcount())
         elif topic == "Headcount":
-            show_headcount(df)
+            show_headcount(headcount_cube())
         elif topic == "Recruitment":
-            show_recruitment(df)
+            show_recruitment(headcount_cube())
         elif topic == "Demographics":
-            show_demographics(df)
+            show_demographics(headcount_cube())
         elif topic == "Dataframe":
-            show_dataframe(df)
+            show_dataframe(people_data())
 
     with tab_about:
         st.write(
@@ -117,36 +152,32 @@ def main():
             """
             )
 
-def show_trend(df):
-    trend_layout(df)
+def show_trend(df, daily_headcount=None):
+    trend_layout(df, daily_headcount)
 
-def show_headcount(df):
-    headcount_layout(df)
+def show_headcount(cube):
+    headcount_layout(cube)
 
-def show_recruitment(df):
-    recruitment_layout(df)
+def show_recruitment(cube):
+    recruitment_layout(cube)
     
-def show_demographics(df):
-    demographics_layout(df)
+def show_demographics(cube):
+    demographics_layout(cube)
 
 def show_dataframe(df):
     dataframe_layout(df)    
 
 # Layout
-def trend_layout(df):
+def trend_layout(df, daily_headcount=None):
     col1, col2 = st.columns(2)
     with col1:
-        df['HIRED_DATE'] = pd.to_datetime(df['HIRED_DATE'])
-        df['END_DATE'] = pd.to_datetime(df['END_DATE'])
-
-        # # Generate date range
-        date_range = pd.date_range(start=df['HIRED_DATE'].min(), end=datetime(2024,3,1))
-        # # Initialize a Series to hold the count for each date
-        date_counts = pd.Series(index=date_range, data='DATE')
-    # Count qualifying records for each date
-    
-        for single_date in date_range:
-            date_counts[single_date] = ((df['HIRED_DATE'] <= single_date) &( (df['END_DATE'] >= single_date) | pd.isna(df['END_DATE']))).sum()
+        granularity = st.radio("Granularity", list(GRANULARITIES), horizontal=True, label_visibility="collapsed")
+        if daily_headcount is not None:
+            # Maintained incrementally by the PeopleDataset.
+            date_counts = resample_headcount(daily_headcount, granularity)
+        else:
+            # Single pass over hire/termination events instead of re-scanning every employee per day.
+            date_counts = headcount_over_time(df, granularity=granularity)
         label = "### Headcount Over Time: " + f"{date_counts.iloc[-1]:,}"
         st.markdown(label)        
         show_cumulative_headcount(date_counts)
@@ -154,32 +185,35 @@ def trend_layout(df):
         # st.markdown("### Headcount by Division")
         # show_headcount_by_division(df)
         
-def headcount_layout(df):
+def headcount_layout(cube):
     r1col1, r1col2 = st.columns(2)
     with r1col1:
         st.markdown("### Headcount by Division")
-        show_headcount_by_division(df)
+        show_headcount_by_division(cube.counts("DIVISION_NAME"))
     with r1col2:
         st.markdown("### Headcount by Department")
-        show_headcount_by_department(df)        
+        divisions = cube.counts("DIVISION_NAME")["DIVISION_NAME"].tolist()
+        division = st.selectbox("Division", ["All"] + divisions, label_visibility="collapsed")
+        filters = {} if division == "All" else {"DIVISION_NAME": division}
+        show_headcount_by_department(cube.counts("DEPARTMENT_NAME", **filters))        
         
-def recruitment_layout(df):
+def recruitment_layout(cube):
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("### Historical Hirings")
-        show_hirings(df)
+        show_hirings(cube.counts("HIRED_DATE"))
     with col2:
         st.markdown("### Historical Departure")
-        show_departures(df)
+        show_departures(cube.counts("END_DATE"))
 
-def demographics_layout(df):
+def demographics_layout(cube):
     col1, col2 = st.columns(2)
     with col1:
         st.markdown("### Headcount by Age")
-        show_headcount_by_age(df)
+        show_headcount_by_age(cube.counts("AGE"))
     with col2:
         st.markdown("### Headcount by Education")
-        show_headcount_by_education(df)
+        show_headcount_by_education(cube.counts("EDUCATION"))
 
 def dataframe_layout(df):
     col1, col2 = st.columns(2)
@@ -190,32 +224,23 @@ def dataframe_layout(df):
 def show_cumulative_headcount(df):
      chart = st.line_chart(df, width=200, height=260)
 
-def show_headcount_by_division(df):
-    counts_by_division_df = df.groupby('DIVISION_NAME')['DIVISION_NAME'].count().reset_index(name='Count')
+def show_headcount_by_division(counts_by_division_df):
     bar_chart = st.bar_chart(data=counts_by_division_df,x='DIVISION_NAME')
 
-def show_headcount_by_department(df):
-    counts_by_department_df = df.groupby('DEPARTMENT_NAME')['DEPARTMENT_NAME'].count().reset_index(name='Count')
+def show_headcount_by_department(counts_by_department_df):
     bar_chart = st.bar_chart(data=counts_by_department_df,x='DEPARTMENT_NAME')
 
-def show_headcount_by_age(df):
-    df['AGE'] = df['BIRTH_DATE'].apply(calculate_age)
-    counts_by_age_df = df.groupby('AGE')['AGE'].count().reset_index(name='Count')
+def show_headcount_by_age(counts_by_age_df):
     bar_chart = st.bar_chart(data=counts_by_age_df,x='AGE')
 
-def show_headcount_by_education(df):
-    counts_by_education_df = df.groupby('EDUCATION')['EDUCATION'].count().reset_index(name='Count')
+def show_headcount_by_education(counts_by_education_df):
     bar_chart = st.bar_chart(data=counts_by_education_df,x='EDUCATION')   
 
-def show_hirings(df):
-    hiring_counts_df = df.groupby('HIRED_DATE')['HIRED_DATE'].count().reset_index(name='Count')    
+def show_hirings(hiring_counts_df):
     # chart = st.line_chart(hiring_counts_df.set_index('HIRED_DATE'),width=200, height=260)
     chart = st.line_chart(hiring_counts_df, x="HIRED_DATE", y="Count", width=200, height=260)
 
-def show_departures(df):
-    df['END_DATE'] = pd.to_datetime(df['END_DATE'])
-    df = df[df['END_DATE'] < datetime.today()]
-    departures_counts_df = df.groupby('END_DATE')['END_DATE'].count().reset_index(name='Count')    
+def show_departures(departures_counts_df):
     chart = st.line_chart(departures_counts_df, x="END_DATE", y="Count", width=200, height=260)    
 
 def show_dataframe(df):
@@ -1,3 +1,7 @@
+import os
+import tempfile
+import time
+import numpy as np
 import streamlit as st
 from streamlit.components.v1 import html
 from datetime import datetime
@@ -6,7 +10,11 @@ import altair as alt
 from streamlit_pills import pills
 
 # Utils imports
-from utils import run_query, init_connection  
+from utils import run_query, init_connection, get_config
+from taxi_stats import CASH, CREDIT_CARD, PAYMENT_TYPES, TAXI_CSV, read_taxi_chunks, stream_ttest, write_sample_csv
+from taxi_ingest import ingest_csv, iter_frames, load_columns, timed_load
+from taxi_partitions import FARE_BIN_EDGES, PartialAggregate, iter_aggregates, partition_files
+from taxi_resampling import distance_strata, prepare, resample
 
 # Set Streamlit page configuration at the beginning
 st.set_page_config(page_title="NYC Taxi A/B Test Demo", page_icon="🚕", layout="wide")
@@ -207,8 +215,11 @@ print(f"P-value: {p_value}")
 # P-value: 6.797387473030518e-12
 '''
     st.code(body2, language="python")
+    source = ttest_layout()
+    partitions_layout()
     st.write(":orange[**P-value is much smaller than 0.05, we reject the null hypothesis.**]  Since customers who are required to pay with credit cards tend to pay more, it should be encouraged.")
     st.write("This project operates under the assumption that passengers were required to use a specific payment method and consistently complied once informed. However, the data wasn't collected with this in mind, so random grouping was necessary to perform the A/B test. The dataset doesn't consider other plausible factors. For instance, riders may prefer credit cards for longer trips because they might not carry enough cash. In other words, it’s more likely that the fare amount influences the payment type, rather than the payment type determining the fare.")
+    resampling_layout(source)
     # col1, col2 = st.columns(2)
     # with col1:
     #     st.markdown("### Historical Hirings")
@@ -217,6 +228,169 @@ print(f"P-value: {p_value}")
     #     st.markdown("### Historical Departure")
     #     show_departures(df)
 
+# Mock-up TLC-like CSV written once per process, for running without the TLC file.
+@st.cache_resource
+def sample_taxi_csv(rows=1_000_000):
+    return write_sample_csv(os.path.join(tempfile.gettempdir(), f"taxi_sample_{rows}.csv"), rows)
+
+def ttest_layout():
+    st.subheader("Run the test")
+    st.write("The file is read in chunks; per payment type running count, mean and variance are merged chunk by chunk, so the test runs in constant memory on files of any size and updates as each chunk arrives.")
+    csv_path = get_config("nyc_taxi").get("csv_path", TAXI_CSV)
+    sources = ["Upload a TLC CSV", "Mock-up sample (1M trips)"]
+    if os.path.exists(csv_path):
+        sources.insert(0, csv_path)
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        source_name = st.radio("Data", sources, horizontal=True)
+        source = None
+        if source_name == "Upload a TLC CSV":
+            source = st.file_uploader("TLC trip data CSV (needs payment_type and fare_amount columns)", type="csv")
+        elif source_name == "Mock-up sample (1M trips)":
+            source = sample_taxi_csv()
+        else:
+            source = csv_path
+    with col2:
+        chunksize = st.select_slider("Rows per chunk", [50_000, 100_000, 250_000, 500_000], value=250_000)
+        use_cache = st.checkbox("Columnar cache", value=True,
+                                help="Convert the CSV once to a compact Arrow file and memory-map it on later runs.")
+    if not st.button("Run Welch's t-test", disabled=source is None):
+        return source
+    columns = ["payment_type", "fare_amount"]
+    if use_cache:
+        with st.spinner("Converting to the columnar cache (first run only)..."):
+            path = ingest_csv(source, get_config("nyc_taxi").get("cache_dir"))
+        table, seconds = timed_load(path, columns)
+        st.caption(f"Memory-mapped {table.num_rows:,} rows of {', '.join(columns)} "
+                   f"({table.nbytes / 2**20:.1f} MB) in {seconds * 1000:.1f} ms.")
+        chunks = iter_frames(path, columns, chunksize)
+    else:
+        chunks = read_taxi_chunks(source, chunksize)
+    status = st.empty()
+    chart = st.empty()
+    history = []
+    for result in stream_ttest(chunks, CREDIT_CARD, CASH):
+        history.append({"rows": result["rows"], "t_statistic": result["t_statistic"]})
+        groups = result["groups"]
+        with status.container():
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Rows read", f"{result['rows']:,}")
+            col2.metric("Mean fare, credit card", f"{groups.get(CREDIT_CARD, {}).get('mean', float('nan')):.4f}")
+            col3.metric("Mean fare, cash", f"{groups.get(CASH, {}).get('mean', float('nan')):.4f}")
+            col4.metric("T-statistic", f"{result['t_statistic']:.4f}")
+            st.write(f"P-value: {result['p_value']:.6g}, degrees of freedom: {result['df']:,.1f}")
+        chart.line_chart(pd.DataFrame(history), x="rows", y="t_statistic", height=220)
+    if not history:
+        st.warning("The file has no rows.")
+        return source
+    by_payment = pd.DataFrame([{"payment_type": PAYMENT_TYPES.get(int(key), key), **moments} for key, moments in groups.items()])
+    st.dataframe(by_payment, hide_index=True, use_container_width=True)
+    if result["p_value"] < 0.05:
+        st.write(":orange[**P-value is smaller than 0.05, we reject the null hypothesis.**]")
+    else:
+        st.write(":orange[**P-value is not smaller than 0.05, we fail to reject the null hypothesis.**]")
+    return source
+
+# Mock-up monthly partitions written once per process.
+@st.cache_resource
+def sample_partitions(months=12, rows=250_000):
+    directory = os.path.join(tempfile.gettempdir(), "taxi_sample_partitions")
+    os.makedirs(directory, exist_ok=True)
+    return [write_sample_csv(os.path.join(directory, f"yellow_tripdata_2017-{month:02d}.csv"), rows, seed=month)
+            for month in range(1, months + 1)]
+
+def partitions_layout():
+    st.subheader("Across many files")
+    st.write("For several years of TLC data, each monthly file is aggregated in its own worker process into per payment type count, sum, moments, min/max and a fare histogram. These partial results merge exactly, so the statistics and the t-test cover all files and scale with the number of cores.")
+    config = get_config("nyc_taxi")
+    pattern = config.get("partitions")
+    sources = ["Mock-up sample (12 monthly files)"]
+    if pattern:
+        sources.insert(0, pattern)
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        source_name = st.radio("Files", sources, horizontal=True, key="partition_source")
+        paths = partition_files(pattern) if source_name == pattern else sample_partitions()
+        st.caption(f"{len(paths)} files: {', '.join(os.path.basename(path) for path in paths[:3])}{', ...' if len(paths) > 3 else ''}")
+    with col2:
+        cpus = os.cpu_count() or 1
+        workers = st.slider("Worker processes", 1, max(cpus, 2), cpus)
+    if not st.button("Aggregate files", disabled=not paths):
+        return
+    total = PartialAggregate()
+    progress = st.progress(0.0, text="Starting workers...")
+    started = time.perf_counter()
+    for done, (path, partial) in enumerate(iter_aggregates(paths, workers, cache_dir=config.get("cache_dir")), 1):
+        total.merge(partial)
+        progress.progress(done / len(paths), text=f"{done}/{len(paths)} files, {total.rows:,} rows")
+    seconds = time.perf_counter() - started
+    progress.empty()
+    result = total.ttest(CREDIT_CARD, CASH)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Rows", f"{total.rows:,}")
+    col2.metric("Rows per second", f"{total.rows / seconds:,.0f}")
+    col3.metric("T-statistic", f"{result['t_statistic']:.4f}")
+    col4.metric("P-value", f"{result['p_value']:.6g}")
+    described = total.describe()
+    described.insert(0, "payment_type", [PAYMENT_TYPES.get(key, key) for key in described.index])
+    st.dataframe(described, hide_index=True, use_container_width=True)
+    histograms = pd.DataFrame({
+        "fare_amount": np.repeat(FARE_BIN_EDGES[1:-2], 2),
+        "payment_type": np.tile([PAYMENT_TYPES[CREDIT_CARD], PAYMENT_TYPES[CASH]], len(FARE_BIN_EDGES) - 3),
+        "share": np.column_stack([total.get(key).histogram[1:-1] / max(total.get(key).moments.count, 1)
+                                  for key in (CREDIT_CARD, CASH)]).ravel(),
+    })
+    st.altair_chart(alt.Chart(histograms).mark_line().encode(
+        x=alt.X("fare_amount", title="Fare amount"), y=alt.Y("share", title="Share of trips"), color="payment_type"
+    ), use_container_width=True)
+    by_file = pd.DataFrame([{"file": os.path.basename(path), **values} for path, values in sorted(total.partitions.items())])
+    with st.expander("Per-file timings"):
+        st.dataframe(by_file, hide_index=True, use_container_width=True)
+
+def resampling_layout(source):
+    st.subheader("Resampling tests")
+    st.write("A permutation test shuffles the payment labels and a bootstrap resamples each group; neither assumes normal fares. Stratifying by trip distance bins compares card and cash fares within each bin and averages the differences weighted by bin size; labels are shuffled, and groups resampled, only within a bin. Both tests then ask whether payment type matters beyond the longer trips card riders take.")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        kind = st.radio("Test", ["permutation", "bootstrap"], horizontal=True, format_func=str.capitalize)
+        resamples = st.select_slider("Resamples", [200, 500, 1_000, 2_000, 5_000, 10_000], value=1_000)
+    with col2:
+        rows = st.select_slider("Rows (random subset)", [10_000, 50_000, 100_000, 250_000, "All"], value=100_000)
+        bins = st.slider("Trip distance bins (1 = no stratification)", 1, 20, 10)
+    with col3:
+        seed = st.number_input("Seed", 0, value=0)
+        cpus = os.cpu_count() or 1
+        workers = st.slider("Worker processes", 1, max(cpus, 2), cpus, key="resampling_workers")
+    if not st.button("Run resampling test", disabled=source is None):
+        return
+    with st.spinner("Loading trips..."):
+        path = ingest_csv(source, get_config("nyc_taxi").get("cache_dir"))
+        df = load_columns(path, ["payment_type", "fare_amount", "trip_distance"]).to_pandas()
+    df = df[df["payment_type"].isin([CREDIT_CARD, CASH])].dropna()
+    if rows != "All" and len(df) > rows:
+        df = df.sample(rows, random_state=seed)
+    strata = distance_strata(df["trip_distance"], bins) if bins > 1 else None
+    data = prepare(df["fare_amount"], df["payment_type"].to_numpy() == CREDIT_CARD, strata)
+    with st.spinner(f"Running {resamples:,} {kind} resamples on {len(df):,} trips..."):
+        result = resample(kind, data, resamples, seed, workers)
+    col1, col2, col3, col4 = st.columns(4)
+    if strata is None:
+        col1.metric("Mean fare difference (card - cash)", f"{result['observed']:.4f}")
+    else:
+        col1.metric("Distance-adjusted difference (card - cash)", f"{result['observed']:.4f}",
+                    f"{result['observed'] - result['raw_difference']:+.4f} vs unadjusted", delta_color="off")
+    if kind == "permutation":
+        col2.metric("P-value", f"{result['p_value']:.4g}")
+    else:
+        col2.metric("95% interval", f"{result['ci_low']:.3f} to {result['ci_high']:.3f}")
+    col3.metric("Resamples per second", f"{result['resamples_per_second']:,.0f}")
+    col4.metric("Seconds", f"{result['seconds']:.2f}")
+    replicates = pd.DataFrame({"difference": result["replicates"]})
+    histogram = alt.Chart(replicates).mark_bar().encode(
+        x=alt.X("difference", bin=alt.Bin(maxbins=60), title="Resampled mean difference"), y=alt.Y("count()", title="Resamples"))
+    observed = alt.Chart(pd.DataFrame({"difference": [result["observed"]]})).mark_rule(color="orange").encode(x="difference")
+    st.altair_chart(histogram + observed, use_container_width=True)
+
 def demographics_layout(df):
     col1, col2 = st.columns(2)
     with col1:
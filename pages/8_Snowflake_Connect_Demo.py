@@ -1,12 +1,14 @@
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit.hello.utils import show_code
-import snowflake.connector
 from urllib.error import URLError
 
 import altair as alt
 import pandas as pd
 
+# Utils imports: queries share the process-wide Snowflake connection pool
+from utils import run_query, stream_dataframe, connection_pool_stats, get_query_cache
+
 # embed streamlit docs in a streamlit app
 st.set_page_config(page_title="Snowflake Demo", page_icon="❄️", layout="wide")
 st.title("Snowflake Connectivity Demo")
@@ -16,24 +18,6 @@ st.sidebar.markdown("## Seasoned Data Analytics Professional")
 st.sidebar.markdown("chrischen.analytics@gmail.com")
 st.sidebar.markdown("https://www.linkedin.com/in/chrischenanalytics")
 
-def init_connection():
-    return snowflake.connector.connect(
-        user=st.secrets["connections"]["snowflake"]["user"],
-        password=st.secrets["connections"]["snowflake"]["password"],
-        account=st.secrets["connections"]["snowflake"]["account"],
-        warehouse=st.secrets["connections"]["snowflake"]["warehouse"],
-        database=st.secrets["connections"]["snowflake"]["database"],
-        schema=st.secrets["connections"]["snowflake"]["schema"]
-    )
-
-conn = init_connection()
-
-# Function to query data from Snowflake
-def run_query(query):
-    with conn.cursor() as cur:
-        cur.execute(query)
-        return cur.fetch_pandas_all()
-    
 @st.cache_data
 def load_country_segment():
     results = run_query("SELECT B.N_NAME as COUNTRY, A.C_MKTSEGMENT as Segment, SUM(A.C_ACCTBAL) as Balance from CUSTOMER A LEFT JOIN NATION B ON A.C_NATIONKEY = B.N_NATIONKEY group by B.N_NAME, A.C_MKTSEGMENT ")
@@ -50,6 +34,7 @@ df = None
 with st.container():
     bt1 = st.button("Show Acct Balance by Country, Segment")
     bt2 = st.button("Show Acct Balance by Segment")
+    bt3 = st.button("Stream Customers")
 
 with st.container():
     row = st.columns(2)
@@ -60,3 +45,11 @@ with st.container():
         df = load_segment()    
         row[0].bar_chart(df, x="SEGMENT", y="BALANCE")
         row[1].dataframe(df)
+    elif bt3:
+        # Rendered batch by batch instead of materializing the whole table first.
+        stream_dataframe("SELECT C_CUSTKEY, C_NAME, C_MKTSEGMENT, C_ACCTBAL from CUSTOMER", batch_size=10000, max_rows=100000)
+
+with st.sidebar.expander("Connection pool"):
+    st.json(connection_pool_stats())
+with st.sidebar.expander("Query cache"):
+    st.json(get_query_cache().stats())
@@ -0,0 +1,21 @@
+import multiprocessing
+import sys
+import types
+
+
+def spawn_pool(processes, initializer=None, initargs=()):
+    """multiprocessing Pool of spawned workers that don't re-run the calling page.
+
+    Spawned children re-import ``__main__``, and Streamlit installs the page
+    being run as ``__main__``, so each worker would execute the whole page.
+    All workers are started up front with a bare ``__main__`` in its place;
+    tasks must live in importable modules. Spawning rather than forking keeps
+    the multi-threaded server from deadlocking its children.
+    """
+    context = multiprocessing.get_context("spawn")
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        return context.Pool(processes, initializer, initargs)
+    finally:
+        sys.modules["__main__"] = main
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def normalize_sql(query):
+    # Whitespace and a trailing semicolon don't change the result; case might
+    # (string literals, quoted identifiers), so it is kept as-is.
+    return re.sub(r"\s+", " ", query).strip().rstrip(";").strip()
+
+def cache_key(query, target):
+    return hashlib.sha256(f"{target}\n{normalize_sql(query)}".encode("utf-8")).hexdigest()
+
+class QueryCache:
+    """Query results persisted as Parquet files, shared across restarts and replicas.
+
+    Each entry is ``<key>.<expires_at>.parquet`` so expiry can be checked from
+    the directory listing alone. File mtime is bumped on every hit and used as
+    the LRU clock when the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024, default_ttl=3600):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "cc_query_cache")
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "writes": 0, "write_errors": 0}
+
+    def get(self, query, target, as_arrow=False):
+        key = cache_key(query, target)
+        now = time.time()
+        for path, expires_at in self._entries(key):
+            if expires_at <= now:
+                self._remove(path)
+                self._count("expired")
+                continue
+            try:
+                table = pq.read_table(path)
+            except (OSError, pa.ArrowInvalid):
+                # Evicted by another process or half-written; treat as a miss.
+                continue
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                # Evicted or replaced by another process after the read; the
+                # table is already in hand.
+                pass
+            self._count("hits")
+            return table if as_arrow else table.to_pandas()
+        self._count("misses")
+        return None
+
+    def put(self, query, target, data, ttl=None):
+        # data is a pandas DataFrame or a pyarrow Table.
+        ttl = self.default_ttl if ttl is None else ttl
+        key = cache_key(query, target)
+        expires_at = int(time.time() + ttl)
+        path = os.path.join(self.directory, f"{key}.{expires_at}.parquet")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+            pq.write_table(table, tmp_path)
+        except (pa.ArrowException, OSError, TypeError, ValueError):
+            # Some frames (mixed object columns) can't round-trip through Parquet;
+            # they just aren't cached.
+            self._remove(tmp_path)
+            self._count("write_errors")
+            return
+        for old_path, _ in self._entries(key):
+            self._remove(old_path)
+        os.replace(tmp_path, path)
+        self._count("writes")
+        self.evict()
+
+    def get_or_run(self, query, target, run, ttl=None, as_arrow=False):
+        data = self.get(query, target, as_arrow=as_arrow)
+        if data is None:
+            data = run()
+            self.put(query, target, data, ttl=ttl)
+        return data
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            self._count("evictions")
+
+    def invalidate(self, query, target):
+        for path, _ in self._entries(cache_key(query, target)):
+            self._remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                self._remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["bytes"] = self._total_bytes()
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _entries(self, key):
+        prefix = key + "."
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".parquet"):
+                yield os.path.join(self.directory, name), int(name[len(prefix):-len(".parquet")])
+
+    def _total_bytes(self):
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".parquet"):
+                try:
+                    total += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
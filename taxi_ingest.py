@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+
+# Compact types for the TLC yellow taxi columns. Anything not listed keeps the
+# type the CSV reader infers; the unnamed index column is dropped.
+TLC_TYPES = {
+    "VendorID": pa.uint8(),
+    "tpep_pickup_datetime": pa.timestamp("s"),
+    "tpep_dropoff_datetime": pa.timestamp("s"),
+    "passenger_count": pa.uint8(),
+    "trip_distance": pa.float32(),
+    "RatecodeID": pa.uint8(),
+    "PULocationID": pa.uint16(),
+    "DOLocationID": pa.uint16(),
+    "payment_type": pa.uint8(),
+    "fare_amount": pa.float32(),
+    "extra": pa.float32(),
+    "mta_tax": pa.float32(),
+    "tip_amount": pa.float32(),
+    "tolls_amount": pa.float32(),
+    "improvement_surcharge": pa.float32(),
+    "total_amount": pa.float32(),
+    "congestion_surcharge": pa.float32(),
+    "airport_fee": pa.float32(),
+}
+# Flag columns become int8 categoricals over a fixed set of values, so every
+# batch shares one dictionary.
+TLC_FLAGS = {"store_and_fwd_flag": ["N", "Y"]}
+# 2017 files use "03/25/2017 08:55:43 AM"; later ones ISO 8601.
+TIMESTAMP_FORMATS = ["%m/%d/%Y %I:%M:%S %p", pacsv.ISO8601]
+
+_ingest_lock = threading.Lock()
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "tlc_cache")
+
+def cached_path(source, cache_dir=None):
+    """Where ``source`` (a path, or an uploaded file) is cached.
+
+    A path is keyed by its name, size and mtime, so a changed file is ingested
+    again. An upload has no mtime and two uploads can share a name and size,
+    so it is keyed by a hash of its bytes.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        name, size, version = os.path.basename(source), stat.st_size, int(stat.st_mtime)
+    else:
+        name, size, version = source.name, source.size, _content_hash(source)
+    stem = os.path.splitext(name)[0]
+    return os.path.join(cache_dir or default_cache_dir(), f"{stem}.{size}.{version}.arrow")
+
+def ingest_csv(source, cache_dir=None, block_size=64 << 20):
+    """Convert a TLC CSV to an uncompressed Arrow IPC file once; return its path.
+
+    The CSV is streamed block by block and written with the compact types
+    above, so memory stays bounded by ``block_size`` whatever the file size.
+    """
+    path = cached_path(source, cache_dir)
+    with _ingest_lock:
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        columns = _header(source)
+        reader = pacsv.open_csv(
+            source,
+            read_options=pacsv.ReadOptions(block_size=block_size),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=[column for column in columns if column],
+                column_types={column: TLC_TYPES[column] for column in columns if column in TLC_TYPES},
+                timestamp_parsers=TIMESTAMP_FORMATS,
+            ),
+        )
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            writer = None
+            with pa.OSFile(tmp_path, "wb") as sink:
+                for batch in reader:
+                    batch = _encode_flags(batch)
+                    if writer is None:
+                        writer = pa.ipc.new_file(sink, batch.schema)
+                    writer.write_batch(batch)
+                if writer is None:
+                    writer = pa.ipc.new_file(sink, reader.schema)
+                writer.close()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+def load_columns(path, columns=None):
+    """Memory-map a cached file; only the pages of ``columns`` are ever read from disk."""
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.select(columns) if columns else table
+
+def iter_frames(path, columns=None, rows=250_000):
+    # pandas chunks of a cached file, for taxi_stats.stream_ttest.
+    table = load_columns(path, columns)
+    for batch in table.to_batches(max_chunksize=rows):
+        yield batch.to_pandas()
+
+def timed_load(path, columns=None):
+    started = time.perf_counter()
+    table = load_columns(path, columns)
+    return table, time.perf_counter() - started
+
+def _content_hash(source, block_size=8 << 20):
+    source.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(block_size), b""):
+        digest.update(block)
+    source.seek(0)
+    return digest.hexdigest()[:16]
+
+def _header(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", newline="") as f:
+            line = f.readline()
+    else:
+        line = source.readline().decode("utf-8")
+        source.seek(0)
+    return [column.strip().strip('"') for column in line.rstrip("\r\n").split(",")]
+
+def _encode_flags(batch):
+    for column, values in TLC_FLAGS.items():
+        index = batch.schema.get_field_index(column)
+        if index < 0:
+            continue
+        dictionary = pa.array(values)
+        codes = pc.index_in(batch.column(index).cast(pa.string()), value_set=dictionary).cast(pa.int8())
+        batch = batch.set_column(index, column, pa.DictionaryArray.from_arrays(codes, dictionary))
+    return batch
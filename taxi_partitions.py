@@ -0,0 +1,149 @@
+import functools
+import glob
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from process_pool import spawn_pool
+from taxi_ingest import ingest_csv, load_columns
+from taxi_stats import Moments, welch_ttest
+
+
+# Fixed fare bins shared by every partition, so histograms merge by adding
+# counts. Fares outside the range land in the open-ended first/last bins.
+FARE_BIN_EDGES = np.concatenate([[-np.inf], np.arange(0, 100.5, 0.5), [np.inf]])
+
+
+class GroupAggregate:
+    """Mergeable summary of one group's values: moments, sum, min, max and histogram.
+
+    The second moment is kept as Welford's M2 (see taxi_stats.Moments) rather
+    than a raw sum of squares, which loses precision over billions of fares.
+    """
+
+    __slots__ = ("moments", "total", "minimum", "maximum", "histogram")
+
+    def __init__(self, bin_edges=FARE_BIN_EDGES):
+        self.moments = Moments()
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.histogram = np.zeros(len(bin_edges) - 1, dtype="int64")
+
+    def update(self, values, bin_edges=FARE_BIN_EDGES):
+        if len(values) == 0:
+            return self
+        self.moments.update(values)
+        self.total += float(values.sum())
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        self.histogram += np.histogram(values, bins=bin_edges)[0]
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        return self
+
+    def quantile(self, q, bin_edges=FARE_BIN_EDGES):
+        # Approximate: linear within the bin holding the q-th value, clamped to min/max.
+        count = self.histogram.sum()
+        if count == 0:
+            return math.nan
+        cumulative = np.cumsum(self.histogram)
+        i = int(np.searchsorted(cumulative, q * count))
+        low = max(bin_edges[i], self.minimum)
+        high = min(bin_edges[i + 1], self.maximum)
+        before = cumulative[i - 1] if i else 0
+        return float(low + (high - low) * (q * count - before) / self.histogram[i])
+
+    def as_dict(self):
+        return {"count": self.moments.count, "sum": self.total, "mean": self.moments.mean,
+                "std": math.sqrt(self.moments.variance), "min": self.minimum,
+                "median": self.quantile(0.5), "max": self.maximum}
+
+class PartialAggregate:
+    """Per-group GroupAggregates over one or more partitions (files)."""
+
+    def __init__(self, group_column="payment_type", value_column="fare_amount"):
+        self.group_column = group_column
+        self.value_column = value_column
+        self.groups = {}
+        self.rows = 0
+        self.partitions = {}
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        values = chunk[self.value_column].to_numpy(dtype="float64", na_value=np.nan)
+        groups = chunk[self.group_column].to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~(np.isnan(values) | np.isnan(groups))
+        values, groups = values[valid], groups[valid]
+        order = np.argsort(groups, kind="stable")
+        keys, starts = np.unique(groups[order], return_index=True)
+        for key, part in zip(keys, np.split(values[order], starts[1:])):
+            self.groups.setdefault(int(key), GroupAggregate()).update(part)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.partitions.update(other.partitions)
+        for key, group in other.groups.items():
+            self.groups.setdefault(key, GroupAggregate()).merge(group)
+        return self
+
+    def get(self, key):
+        return self.groups.get(key, GroupAggregate())
+
+    def describe(self):
+        keys = sorted(self.groups)
+        return pd.DataFrame([self.groups[key].as_dict() for key in keys], index=keys)
+
+    def ttest(self, group_a, group_b):
+        return welch_ttest(self.get(group_a).moments, self.get(group_b).moments)
+
+def partition_files(pattern):
+    """TLC files matching a glob (e.g. ``data/yellow_tripdata_20*.parquet``), in name order."""
+    return sorted(path for path in glob.glob(pattern) if path.endswith((".csv", ".parquet")))
+
+def iter_partition(path, columns, rows=1_000_000, cache_dir=None):
+    # Parquet (TLC files from 2022 on) is read directly; CSVs go through the
+    # columnar cache so a second run over the same files skips parsing.
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        table = load_columns(ingest_csv(path, cache_dir), columns)
+        for batch in table.to_batches(max_chunksize=rows):
+            yield batch.to_pandas()
+
+def aggregate_file(path, group_column="payment_type", value_column="fare_amount", cache_dir=None):
+    """Partial aggregate of one file; runs in a worker process."""
+    started = time.perf_counter()
+    partial = PartialAggregate(group_column, value_column)
+    for chunk in iter_partition(path, [group_column, value_column], cache_dir=cache_dir):
+        partial.update(chunk)
+    partial.partitions[path] = {"rows": partial.rows, "seconds": time.perf_counter() - started}
+    return partial
+
+def _aggregate_one(path, group_column, value_column, cache_dir):
+    return path, aggregate_file(path, group_column, value_column, cache_dir)
+
+def iter_aggregates(paths, max_workers=None, group_column="payment_type", value_column="fare_amount", cache_dir=None):
+    """Fan ``paths`` out over a process pool; yield ``(path, partial)`` as each file finishes."""
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, len(paths)))
+    task = functools.partial(_aggregate_one, group_column=group_column, value_column=value_column, cache_dir=cache_dir)
+    with spawn_pool(max_workers) as pool:
+        yield from pool.imap_unordered(task, paths)
+
+def aggregate_files(paths, max_workers=None, group_column="payment_type", value_column="fare_amount", cache_dir=None):
+    total = PartialAggregate(group_column, value_column)
+    for _, partial in iter_aggregates(paths, max_workers, group_column, value_column, cache_dir):
+        total.merge(partial)
+    return total
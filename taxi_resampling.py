@@ -0,0 +1,116 @@
+import math
+import time
+
+import numpy as np
+
+from process_pool import spawn_pool
+
+
+# Resamples per task. Each task gets its own child seed, so results depend
+# only on the seed, never on how many workers ran the tasks.
+TASK_SIZE = 250
+# Upper bound on the elements in one vectorized batch (resamples x rows).
+MAX_BATCH_ELEMENTS = 1 << 24
+
+_worker_data = None
+
+
+def distance_strata(trip_distance, bins=10):
+    """Quantile bin (0..bins-1) of each trip's distance, for stratified resampling."""
+    trip_distance = np.asarray(trip_distance, dtype="float64")
+    edges = np.unique(np.nanquantile(trip_distance, np.linspace(0, 1, bins + 1)[1:-1]))
+    return np.searchsorted(edges, trip_distance, side="right")
+
+def prepare(values, in_a, strata=None):
+    """Split the values by stratum (and by group within it) once, for every task to share.
+
+    ``in_a`` marks group A (e.g. credit card) rows; the rest are group B.
+    Strata holding only one group can't be compared and are left out.
+    """
+    values = np.asarray(values, dtype="float64")
+    in_a = np.asarray(in_a, dtype=bool)
+    strata = np.zeros(len(values), dtype="int64") if strata is None else np.asarray(strata)
+    order = np.argsort(strata, kind="stable")
+    _, starts = np.unique(strata[order], return_index=True)
+    cells = []
+    for rows in np.split(order, starts[1:]):
+        a, b = values[rows][in_a[rows]], values[rows][~in_a[rows]]
+        if len(a) and len(b):
+            cells.append({"values": values[rows], "labels": in_a[rows].astype("float64"), "a": a, "b": b,
+                          "n_a": len(a), "n_b": len(b), "total": float(values[rows].sum())})
+    rows = sum(len(cell["values"]) for cell in cells)
+    for cell in cells:
+        cell["weight"] = len(cell["values"]) / rows
+    return {"cells": cells, "rows": rows, "dropped": len(values) - rows,
+            "raw_difference": float(values[in_a].mean() - values[~in_a].mean()) if in_a.any() and (~in_a).any() else math.nan}
+
+def adjusted_difference(data):
+    """Stratum-size weighted mean of the per-stratum A - B differences.
+
+    With one stratum this is the plain difference of means. With distance
+    strata it compares trips of similar length only, so its null (labels
+    shuffled within strata) is centred on 0.
+    """
+    return sum(cell["weight"] * (cell["a"].mean() - cell["b"].mean()) for cell in data["cells"])
+
+def _permutation_batch(data, rng, count):
+    # Labels are shuffled within each stratum; one matrix-vector product per
+    # stratum then gives group A's sum for every resample in the batch.
+    difference = np.zeros(count)
+    for cell in data["cells"]:
+        labels = np.tile(cell["labels"], (count, 1))
+        rng.permuted(labels, axis=1, out=labels)
+        sum_a = labels @ cell["values"]
+        difference += cell["weight"] * (sum_a / cell["n_a"] - (cell["total"] - sum_a) / cell["n_b"])
+    return difference
+
+def _bootstrap_batch(data, rng, count):
+    # Each group is resampled with replacement within each stratum, keeping
+    # the cell sizes, and the same weighted difference is taken.
+    difference = np.zeros(count)
+    for cell in data["cells"]:
+        mean_a, mean_b = (values[rng.integers(0, len(values), (count, len(values)))].mean(axis=1)
+                          for values in (cell["a"], cell["b"]))
+        difference += cell["weight"] * (mean_a - mean_b)
+    return difference
+
+BATCHES = {"permutation": _permutation_batch, "bootstrap": _bootstrap_batch}
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _run_task(kind, seed, count, data=None):
+    data = data or _worker_data
+    rng = np.random.default_rng(seed)
+    largest = max(max(len(cell["values"]) for cell in data["cells"]), 1)
+    batch = max(1, MAX_BATCH_ELEMENTS // largest)
+    return np.concatenate([BATCHES[kind](data, rng, min(batch, count - done)) for done in range(0, count, batch)])
+
+def resample(kind, data, resamples=1000, seed=0, max_workers=1):
+    """Run ``resamples`` permutation or bootstrap replicates of the mean difference.
+
+    The statistic is ``adjusted_difference``. Returns its observed value,
+    the replicate distribution, a two-sided p-value (permutation) or a 95%
+    percentile interval (bootstrap), and the throughput.
+    """
+    if not data["cells"]:
+        raise ValueError("No stratum holds trips from both groups.")
+    started = time.perf_counter()
+    counts = [min(TASK_SIZE, resamples - done) for done in range(0, resamples, TASK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    if max_workers > 1 and len(counts) > 1:
+        with spawn_pool(min(max_workers, len(counts)), _init_worker, (data,)) as pool:
+            parts = pool.starmap(_run_task, zip([kind] * len(counts), seeds, counts))
+    else:
+        parts = [_run_task(kind, s, count, data) for s, count in zip(seeds, counts)]
+    replicates = np.concatenate(parts)
+    seconds = time.perf_counter() - started
+    observed = adjusted_difference(data)
+    result = {"kind": kind, "observed": observed, "raw_difference": data["raw_difference"], "replicates": replicates, "resamples": resamples,
+              "seconds": seconds, "resamples_per_second": resamples / seconds if seconds else math.nan}
+    if kind == "permutation":
+        result["p_value"] = (np.sum(np.abs(replicates) >= abs(observed)) + 1) / (resamples + 1)
+    else:
+        result["ci_low"], result["ci_high"] = np.percentile(replicates, [2.5, 97.5])
+    return result
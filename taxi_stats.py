@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+TAXI_CSV = "2017_Yellow_Taxi_Trip_Data.csv"
+# TLC payment_type codes compared in the A/B test.
+CREDIT_CARD = 1
+CASH = 2
+PAYMENT_TYPES = {1: "Credit card", 2: "Cash", 3: "No charge", 4: "Dispute", 5: "Unknown", 6: "Voided trip"}
+
+
+class Moments:
+    """Running count, mean and sum of squared deviations (Welford).
+
+    Batches are folded in with Chan et al.'s pairwise update, so accumulators
+    built over separate chunks or files merge into exactly what one pass over
+    all the values would give.
+    """
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def of(cls, values):
+        values = np.asarray(values, dtype="float64")
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        return cls(len(values), float(mean), float(((values - mean) ** 2).sum()))
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    def update(self, values):
+        return self.merge(Moments.of(values))
+
+    @property
+    def variance(self):
+        # Sample variance (ddof=1), as in scipy.stats.ttest_ind.
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def as_dict(self):
+        return {"count": self.count, "mean": self.mean, "variance": self.variance}
+
+class GroupedMoments:
+    """Moments of ``value_column`` per ``group_column`` value, updated chunk by chunk."""
+
+    def __init__(self, group_column="payment_type", value_column="fare_amount"):
+        self.group_column = group_column
+        self.value_column = value_column
+        self.groups = {}
+        self.rows = 0
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        values = chunk[self.value_column].to_numpy(dtype="float64")
+        groups = chunk[self.group_column].to_numpy()
+        valid = ~(np.isnan(values) | pd.isna(groups))
+        values, groups = values[valid], groups[valid]
+        # One sort per chunk; each group's values are then a contiguous slice.
+        order = np.argsort(groups, kind="stable")
+        keys, starts = np.unique(groups[order], return_index=True)
+        for key, part in zip(keys, np.split(values[order], starts[1:])):
+            self.groups.setdefault(key.item(), Moments()).update(part)
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        for key, moments in other.groups.items():
+            self.groups.setdefault(key, Moments()).merge(moments)
+        return self
+
+    def get(self, key):
+        return self.groups.get(key, Moments())
+
+def welch_ttest(a, b):
+    """Two-sided Welch's t-test from two Moments; matches ttest_ind(equal_var=False)."""
+    if a.count < 2 or b.count < 2:
+        return {"t_statistic": math.nan, "df": math.nan, "p_value": math.nan}
+    va, vb = a.variance / a.count, b.variance / b.count
+    t = (a.mean - b.mean) / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (a.count - 1) + vb ** 2 / (b.count - 1))
+    return {"t_statistic": t, "df": df, "p_value": float(2 * stats.t.sf(abs(t), df))}
+
+def read_taxi_chunks(source, chunksize=250_000, columns=("payment_type", "fare_amount")):
+    # Only the needed columns are parsed, with compact dtypes.
+    dtypes = {"payment_type": "float32", "fare_amount": "float64"}
+    return pd.read_csv(source, usecols=list(columns), chunksize=chunksize,
+                       dtype={column: dtypes.get(column, "float64") for column in columns})
+
+def stream_ttest(chunks, group_a=CREDIT_CARD, group_b=CASH, group_column="payment_type", value_column="fare_amount"):
+    """Yield the running test after every chunk, in constant memory.
+
+    Each result has ``rows`` read so far, per-group moments and Welch's t-test
+    of ``group_a`` vs ``group_b``; the last one covers the whole input.
+    """
+    moments = GroupedMoments(group_column, value_column)
+    for chunk in chunks:
+        moments.update(chunk)
+        a, b = moments.get(group_a), moments.get(group_b)
+        yield {"rows": moments.rows, "groups": {key: m.as_dict() for key, m in sorted(moments.groups.items())},
+               **welch_ttest(a, b)}
+
+def sample_taxi_trips(rows=1_000_000, seed=0):
+    """Mock-up TLC-like trips (payment_type, fare_amount, ...) for running without the TLC file."""
+    rng = np.random.default_rng(seed)
+    payment_type = rng.choice([1, 2, 3, 4], rows, p=[0.67, 0.32, 0.006, 0.004])
+    trip_distance = np.round(rng.gamma(1.6, 1.8, rows), 2)
+    # Card riders take slightly longer trips, so their fares come out higher.
+    trip_distance *= np.where(payment_type == 1, 1.08, 1.0)
+    fare_amount = np.round(2.5 + 2.6 * trip_distance + rng.normal(0, 2.0, rows).clip(-2, None), 1)
+    return pd.DataFrame({
+        "passenger_count": rng.choice([1, 2, 3, 4, 5, 6], rows, p=[0.7, 0.14, 0.04, 0.02, 0.06, 0.04]),
+        "trip_distance": trip_distance,
+        "payment_type": payment_type,
+        "fare_amount": fare_amount,
+        "tip_amount": np.where(payment_type == 1, np.round(fare_amount * rng.uniform(0.1, 0.25, rows), 2), 0.0),
+    })
+
+def write_sample_csv(path, rows=1_000_000, seed=0):
+    sample_taxi_trips(rows, seed).to_csv(path)
+    return path
@@ -0,0 +1,38 @@
+import time
+
+from utils import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def cursor(self):
+        raise AssertionError("not pinged in these tests")
+
+
+def test_idle_connections_are_reaped_without_new_queries():
+    pool = ConnectionPool(connect=FakeConnection, max_size=2, max_idle_seconds=0.2)
+    with pool.connection() as first, pool.connection() as second:
+        pass
+    assert pool.stats()["idle"] == 2
+    time.sleep(0.6)
+    assert first.closed and second.closed
+    stats = pool.stats()
+    assert stats["idle"] == 0 and stats["reaped"] == 2
+
+
+def test_checkin_reaps_connections_that_expired_meanwhile():
+    pool = ConnectionPool(connect=FakeConnection, max_size=2, max_idle_seconds=60)
+    stale = FakeConnection()
+    with pool.connection() as conn:
+        pool._idle.append((stale, time.monotonic() - 120))
+    assert stale.closed and not conn.closed
+    assert pool.stats()["idle"] == 1
+    pool.close_all()
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from people_analytics import headcount_over_time, headcount_over_time_loop
+
+
+def test_headcount_skips_employees_without_a_hire_date():
+    df = pd.DataFrame({
+        "HIRED_DATE": pd.to_datetime(["2024-01-01", None, "2024-01-03", None]),
+        "END_DATE": pd.to_datetime(["2024-01-05", "2024-01-02", None, None]),
+    })
+    end = pd.Timestamp("2024-01-08")
+    actual = headcount_over_time(df, end=end)
+    pd.testing.assert_series_equal(actual, headcount_over_time_loop(df, end=end), check_freq=False)
+    assert actual.tolist() == [1, 1, 2, 2, 2, 1, 1, 1]
+
+
+def test_headcount_without_any_hire_date_is_empty():
+    df = pd.DataFrame({"HIRED_DATE": pd.to_datetime([None]), "END_DATE": pd.to_datetime(["2024-01-02"])})
+    assert headcount_over_time(df).empty
+
+
+def test_incremental_refresh_picks_up_a_late_hire_on_the_watermark_date():
+    from datetime import timedelta
+
+    from local_backend import DuckDBBackend
+    from people_analytics import PEOPLE_QUERY, PeopleDataset
+
+    backend = DuckDBBackend(employees=500)
+    dataset = PeopleDataset(backend.run_query)
+    watermark = dataset.watermark.date()
+    with backend.connect() as cur:
+        for employee_id, hired in ((501, watermark), (502, watermark + timedelta(days=1))):
+            cur.execute("INSERT INTO CCMOCKUP.PUBLIC.EMPLOYEE_TEST SELECT ?, ?, DATE '1990-01-01', 'Bachelor', ?, 'Analyst', 'Sales'",
+                        [employee_id, f"Employee {employee_id}", hired])
+    dataset.refresh()
+    assert dataset.last_refresh["mode"] == "incremental"
+
+    full = PeopleDataset(backend.run_query)
+    assert sorted(dataset.frame["EMPLOYEE_ID"]) == sorted(full.frame["EMPLOYEE_ID"]) == list(range(1, 503))
+    counts = lambda cube: dict(cube.counts("DIVISION_NAME").astype({"DIVISION_NAME": str}).itertuples(index=False))
+    assert counts(dataset.cube) == counts(full.cube)
+    pd.testing.assert_series_equal(dataset.daily_headcount, full.daily_headcount, check_freq=False)
@@ -0,0 +1,15 @@
+import os
+from unittest import mock
+
+import pandas as pd
+
+from query_cache import QueryCache
+
+
+def test_hit_survives_the_entry_being_evicted_after_the_read(tmp_path):
+    cache = QueryCache(directory=str(tmp_path))
+    cache.put("SELECT 1", "duckdb://test", pd.DataFrame({"A": [1]}))
+    with mock.patch("query_cache.os.utime", side_effect=FileNotFoundError):
+        result = cache.get("SELECT 1", "duckdb://test")
+    assert result["A"].tolist() == [1]
+    assert cache.stats()["hits"] == 1
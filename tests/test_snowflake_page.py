@@ -0,0 +1,17 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "8_Snowflake_Connect_Demo.py")
+
+
+def test_stream_customers_renders_every_batch(monkeypatch, tmp_path):
+    monkeypatch.setenv("QUERY_BACKEND", "duckdb")
+    at = AppTest.from_file(PAGE, default_timeout=120)
+    at.secrets["query_cache"] = {"directory": str(tmp_path)}
+    at.run()
+    # The DuckDB backend's 15,000 customers arrive in two 10,000-row batches.
+    next(button for button in at.button if button.label == "Stream Customers").click().run()
+    assert not at.exception
+    assert at.dataframe[-1].value.shape == (15_000, 4)
+    assert any(caption.value == "15,000 rows received" for caption in at.caption)
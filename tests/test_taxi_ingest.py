@@ -0,0 +1,24 @@
+import io
+
+from taxi_ingest import cached_path, ingest_csv, load_columns
+
+
+class Upload(io.BytesIO):
+    # The parts of streamlit's UploadedFile that ingest_csv uses.
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def test_uploads_with_the_same_name_and_size_are_cached_separately(tmp_path):
+    header = b"payment_type,fare_amount\n"
+    first = Upload("trips.csv", header + b"1,10.5\n2,7.25\n")
+    second = Upload("trips.csv", header + b"2,10.5\n1,7.25\n")
+    assert first.size == second.size
+    assert cached_path(first, tmp_path) != cached_path(second, tmp_path)
+    assert cached_path(first, tmp_path) == cached_path(Upload("trips.csv", first.getvalue()), tmp_path)
+
+    tables = [load_columns(ingest_csv(upload, tmp_path), ["payment_type"]) for upload in (first, second)]
+    assert tables[0]["payment_type"].to_pylist() == [1, 2]
+    assert tables[1]["payment_type"].to_pylist() == [2, 1]
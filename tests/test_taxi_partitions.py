@@ -0,0 +1,28 @@
+import sys
+import types
+
+import pandas as pd
+from scipy import stats
+
+from taxi_partitions import aggregate_files
+from taxi_stats import write_sample_csv
+
+
+def test_files_aggregate_to_the_statistics_of_their_union(tmp_path, monkeypatch):
+    # Streamlit runs each page as __main__; workers must not re-run it.
+    page = types.ModuleType("__main__")
+    page.__file__ = str(tmp_path / "page_that_must_not_run.py")
+    (tmp_path / "page_that_must_not_run.py").write_text("raise SystemExit('page re-run in a worker')\n")
+    monkeypatch.setitem(sys.modules, "__main__", page)
+
+    paths = [write_sample_csv(str(tmp_path / f"2017-{month:02d}.csv"), 20_000, seed=month) for month in (1, 2, 3)]
+    total = aggregate_files(paths, max_workers=2, cache_dir=str(tmp_path / "cache"))
+
+    df = pd.concat([pd.read_csv(path) for path in paths])
+    expected = df.groupby("payment_type")["fare_amount"].agg(["count", "mean", "min", "max"])
+    described = total.describe()
+    assert total.rows == len(df) and sorted(total.partitions) == sorted(paths)
+    pd.testing.assert_frame_equal(described[["count", "mean", "min", "max"]], expected,
+                                  check_dtype=False, check_names=False, check_index_type=False, rtol=1e-6)
+    ttest = stats.ttest_ind(df[df.payment_type == 1].fare_amount, df[df.payment_type == 2].fare_amount, equal_var=False)
+    assert abs(total.ttest(1, 2)["t_statistic"] - ttest.statistic) < 1e-6
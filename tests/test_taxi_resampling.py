@@ -0,0 +1,60 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from taxi_resampling import adjusted_difference, distance_strata, prepare, resample
+from taxi_stats import CASH, CREDIT_CARD, sample_taxi_trips
+
+
+@pytest.fixture(scope="module")
+def trips():
+    # Card riders take longer trips, so their raw mean fare is higher even
+    # though payment type has no effect within a distance bin.
+    df = sample_taxi_trips(200_000, seed=0)
+    df = df[df["payment_type"].isin([CREDIT_CARD, CASH])].sample(20_000, random_state=0)
+    return df["fare_amount"].to_numpy(), df["payment_type"].to_numpy() == CREDIT_CARD, distance_strata(df["trip_distance"], 10)
+
+
+def test_unstratified_statistic_is_the_mean_difference(trips):
+    fares, card, _ = trips
+    data = prepare(fares, card)
+    assert adjusted_difference(data) == pytest.approx(fares[card].mean() - fares[~card].mean())
+
+
+@pytest.mark.parametrize("kind", ["permutation", "bootstrap"])
+def test_stratified_statistic_removes_distance_confounding(trips, kind):
+    fares, card, strata = trips
+    data = prepare(fares, card, strata)
+    assert data["raw_difference"] > 0.3
+    result = resample(kind, data, 500, seed=1)
+    if kind == "permutation":
+        assert abs(result["replicates"].mean()) < 0.01
+        assert result["p_value"] > 0.05
+    else:
+        assert result["ci_low"] < 0 < result["ci_high"]
+
+
+@pytest.mark.parametrize("shift", [-0.4, 0.4])
+def test_stratified_tests_detect_an_effect_in_either_direction(trips, shift):
+    fares, card, strata = trips
+    data = prepare(fares + shift * card, card, strata)
+    permutation = resample("permutation", data, 500, seed=1)
+    bootstrap = resample("bootstrap", data, 500, seed=1)
+    assert permutation["observed"] == pytest.approx(shift, abs=0.1)
+    assert permutation["p_value"] < 0.01
+    assert bootstrap["ci_low"] < shift < bootstrap["ci_high"]
+
+
+def test_results_depend_on_the_seed_only(trips, tmp_path, monkeypatch):
+    # Streamlit runs each page as __main__; workers must not re-run it.
+    page = types.ModuleType("__main__")
+    page.__file__ = str(tmp_path / "page_that_must_not_run.py")
+    (tmp_path / "page_that_must_not_run.py").write_text("raise SystemExit('page re-run in a worker')\n")
+    monkeypatch.setitem(sys.modules, "__main__", page)
+    fares, card, strata = trips
+    data = prepare(fares, card, strata)
+    one = resample("permutation", data, 600, seed=3, max_workers=1)
+    two = resample("permutation", data, 600, seed=3, max_workers=2)
+    assert np.array_equal(one["replicates"], two["replicates"])
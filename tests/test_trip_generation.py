@@ -0,0 +1,23 @@
+from trip_generation import TripGenerator, create_session
+
+
+class BrokenSession:
+    def post(self, url, json, timeout):
+        raise ValueError("unexpected response")
+
+
+def test_unexpected_errors_still_finish_the_job():
+    generator = TripGenerator(url="http://example.invalid", max_workers=2, session=BrokenSession())
+    job = generator.submit(25, "2024-06-01", "", "gemini-1.5-flash-002")
+    generator._executor.shutdown(wait=True)
+    assert job.done
+    snapshot = job.snapshot()
+    assert snapshot["batches_done"] == 3 and snapshot["trips_generated"] == 0
+    assert snapshot["errors"] == ["unexpected response"] * 3
+    assert generator.stats()["gemini-1.5-flash-002"]["errors"] == 3
+
+
+def test_only_refused_requests_are_retried():
+    retry = create_session().get_adapter("https://").max_retries
+    assert set(retry.status_forcelist) == {429, 503}
+    assert retry.read == 0
@@ -0,0 +1,48 @@
+from datetime import date, datetime, timezone
+
+import pyarrow as pa
+
+from waymo_trips import LOCAL_TRIP_CAPACITY, RecentTrips, build_trip_query
+
+
+def make_trips(trip_dates):
+    n = len(trip_dates)
+    return pa.table({
+        "trip_id": [f"trip-{i}" for i in range(n)],
+        "trip_date": pa.array(trip_dates, pa.date32()),
+        "payment_method": ["Credit Card"] * n,
+        "gen_ai_model": ["gemini-1.5-flash-002"] * n,
+        "insert_timestamp": pa.array([datetime(2024, 6, 1, i, tzinfo=timezone.utc) for i in range(n)],
+                                     pa.timestamp("us", tz="UTC")),
+    })
+
+
+def test_trip_query_without_dates_has_no_date_predicate():
+    sql, job_config, _ = build_trip_query(None, None)
+    assert "trip_date >=" not in sql and "trip_date <=" not in sql
+    assert not any(param.name in ("start_date", "end_date") for param in job_config.query_parameters)
+
+
+def test_trip_query_with_one_bound():
+    sql, job_config, _ = build_trip_query(date(2023, 1, 1), None)
+    assert "trip_date >= @start_date" in sql and "@end_date" not in sql
+
+
+def test_store_index_returns_trips_from_before_may_2024():
+    trips = make_trips([date(2023, 3, 1), date(2024, 5, 2), None])
+
+    def fetch(inserted_since):
+        # The store query has no date range, so BigQuery would return every trip.
+        sql, _, _ = build_trip_query(None, None, limit=LOCAL_TRIP_CAPACITY + 1, inserted_since=inserted_since)
+        assert "trip_date" not in sql.split("WHERE", 1)[1]
+        return trips
+
+    store = RecentTrips(fetch, capacity=LOCAL_TRIP_CAPACITY)
+    assert store.complete
+    index = store.index
+    dates = lambda table: sorted(table["trip_date"].to_pylist(), key=str)
+    assert dates(index.select(date(2023, 1, 1), date(2024, 4, 30))) == [date(2023, 3, 1)]
+    assert dates(index.select(date(2023, 1, 1), None)) == [date(2023, 3, 1), date(2024, 5, 2)]
+    assert dates(index.select(None, date(2024, 12, 31), payment_method="Credit Card")) == [date(2023, 3, 1), date(2024, 5, 2)]
+    # A NULL trip_date only matches when no date bound is given.
+    assert dates(index.select()) == [date(2023, 3, 1), date(2024, 5, 2), None]
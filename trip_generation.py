@@ -0,0 +1,182 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+from urllib3.util.retry import Retry
+
+
+GENERATION_URL = "https://us-west1-waymo-sandbox.cloudfunctions.net/gen-waymo-trip-data"
+# The cloud function generates at most this many trips per request.
+MAX_TRIPS_PER_REQUEST = 10
+# gen_ai_model as stored with the trips -> the name the cloud function takes
+# for it. Jobs and stats are keyed by the stored name.
+GEN_AI_MODELS = {
+    "gpt-3.5-turbo-instruct": "OpenAI gpt-3.5-turbo-instruct",
+    "gemini-1.5-flash-002": "gemini-1.5-flash-002",
+}
+
+
+def create_session(pool_maxsize=8, retries=3, backoff_factor=0.5):
+    """requests.Session with pooled keep-alive connections and retries.
+
+    Only failed connections and 429/503 responses, where the request was
+    refused before reaching the cloud function, are retried (with exponential
+    backoff, honouring Retry-After). A 500, 502 or 504 may come back after
+    trips were already inserted, and retrying it would generate them twice.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, connect=retries, read=0, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 503), allowed_methods=["POST"], raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def split_batches(trip_count, batch_size=MAX_TRIPS_PER_REQUEST):
+    full, rest = divmod(trip_count, batch_size)
+    return [batch_size] * full + ([rest] if rest else [])
+
+class GenerationJob:
+    """One generation request split into batches that run concurrently.
+
+    Progress is updated from the worker threads; ``snapshot()`` is safe to
+    call from the script thread while the job runs.
+    """
+
+    def __init__(self, trip_count, trip_date, prompt_hint, gen_ai_model, batch_size=MAX_TRIPS_PER_REQUEST):
+        self.id = uuid.uuid4().hex[:8]
+        self.gen_ai_model = gen_ai_model
+        self.payloads = [
+            {"trip_count": count, "trip_date": str(trip_date), "prompt_hint": prompt_hint,
+             "gen_ai_model": GEN_AI_MODELS.get(gen_ai_model, gen_ai_model)}
+            for count in split_batches(trip_count, batch_size)
+        ]
+        self.trip_count = trip_count
+        self.submitted_at = datetime.now()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._trips_generated = 0
+        self.errors = []
+        self.latencies = []
+
+    @property
+    def done(self):
+        with self._lock:
+            return self._completed == len(self.payloads)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "gen_ai_model": self.gen_ai_model,
+                "trips_requested": self.trip_count,
+                "trips_generated": self._trips_generated,
+                "batches": len(self.payloads),
+                "batches_done": self._completed,
+                "progress": self._completed / len(self.payloads) if self.payloads else 1.0,
+                "errors": list(self.errors),
+                "submitted_at": self.submitted_at.isoformat(timespec="seconds"),
+                "seconds": ((self.finished_at or datetime.now()) - self.submitted_at).total_seconds(),
+            }
+
+    def _record(self, payload, seconds, error=None):
+        with self._lock:
+            self._completed += 1
+            self.latencies.append(seconds)
+            if error is None:
+                self._trips_generated += payload["trip_count"]
+            else:
+                self.errors.append(error)
+            if self._completed == len(self.payloads):
+                self.finished_at = datetime.now()
+
+class TripGenerator:
+    """Runs GenerationJobs on a shared thread pool and session, and keeps per-model stats."""
+
+    def __init__(self, url=GENERATION_URL, max_workers=4, session=None, timeout=120):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or create_session(pool_maxsize=max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trip-generation")
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def submit(self, trip_count, trip_date, prompt_hint, gen_ai_model, batch_size=MAX_TRIPS_PER_REQUEST):
+        job = GenerationJob(trip_count, trip_date, prompt_hint, gen_ai_model, batch_size)
+        for payload in job.payloads:
+            self._executor.submit(self._post, job, payload)
+        return job
+
+    def stats(self):
+        """Per-model batches, trips, errors, latency (mean/p95) and throughput (trips per second of request time)."""
+        with self._lock:
+            stats = {model: dict(values, latencies=list(values["latencies"])) for model, values in self._stats.items()}
+        for values in stats.values():
+            latencies = np.array(values.pop("latencies"))
+            values["mean_latency_seconds"] = float(latencies.mean()) if len(latencies) else None
+            values["p95_latency_seconds"] = float(np.percentile(latencies, 95)) if len(latencies) else None
+            values["trips_per_second"] = values["trips"] / latencies.sum() if latencies.sum() else None
+        return stats
+
+    def _post(self, job, payload):
+        started = time.perf_counter()
+        error = "worker stopped before the request finished"
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            error = None if response.status_code == 200 else f"status {response.status_code}: {response.text[:200]}"
+        except Exception as e:
+            # Anything, not just RequestException: the batch must still be
+            # recorded, or its job never finishes and the page polls forever.
+            error = str(e) or type(e).__name__
+        finally:
+            seconds = time.perf_counter() - started
+            job._record(payload, seconds, error)
+            with self._lock:
+                values = self._stats.setdefault(job.gen_ai_model, {"batches": 0, "trips": 0, "errors": 0, "latencies": []})
+                values["batches"] += 1
+                values["errors"] += error is not None
+                values["trips"] += payload["trip_count"] if error is None else 0
+                values["latencies"].append(seconds)
+
+
+if __name__ == "__main__":
+    # python trip_generation.py: run a job against a local stub of the cloud
+    # function that takes ~0.2 s per request and throttles every 5th one.
+    import itertools
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    calls = itertools.count(1)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(0.2)
+            status = 503 if next(calls) % 5 == 0 else 200
+            body = json.dumps({"inserted": payload["trip_count"]}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    generator = TripGenerator(url=f"http://127.0.0.1:{server.server_port}", max_workers=4,
+                              session=create_session(pool_maxsize=4, backoff_factor=0.1))
+    jobs = [generator.submit(95, "2024-06-01", "", "gemini-1.5-flash-002"),
+            generator.submit(40, "2024-06-01", "", "gpt-3.5-turbo-instruct")]
+    while not all(job.done for job in jobs):
+        time.sleep(0.1)
+    for job in jobs:
+        print(job.snapshot())
+    print(json.dumps(generator.stats(), indent=2))
+    server.shutdown()
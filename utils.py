@@ -13,10 +13,19 @@
 # limitations under the License.
 
 import inspect
+import os
 import textwrap
+import threading
+import time
+from contextlib import closing, contextmanager
 
+import pandas as pd
+import pyarrow as pa
 import streamlit as st
 import snowflake.connector
+from snowflake.connector.errors import DatabaseError, Error as SnowflakeError
+
+from query_cache import QueryCache
 
 
 def show_code(demo):
@@ -28,7 +37,14 @@ def show_code(demo):
         sourcelines, _ = inspect.getsourcelines(demo)
         st.code(textwrap.dedent("".join(sourcelines[1:])))
 
-def init_connection():
+# Optional settings from .streamlit/secrets.toml; a missing file or section means defaults.
+def get_config(section):
+    try:
+        return st.secrets.get(section, {})
+    except FileNotFoundError:
+        return {}
+
+def init_snowflake_connection():
     return snowflake.connector.connect(
         user=st.secrets["connections"]["snowflake"]["user"],
         password=st.secrets["connections"]["snowflake"]["password"],
@@ -38,9 +54,303 @@ def init_connection():
         schema=st.secrets["connections"]["snowflake"]["schema"]
     )
 
-# Function to query data from Snowflake
-def run_query(query):
-    conn = init_connection()
-    with conn.cursor() as cur:
-        cur.execute(query)
-        return cur.fetch_pandas_all()
\ No newline at end of file
+# Snowflake error numbers meaning the session or its token is gone and a fresh
+# login is required (session no longer exists / session expired / token expired).
+EXPIRED_SESSION_ERRNOS = {390111, 390112, 390114}
+
+def is_expired_session_error(error):
+    return getattr(error, "errno", None) in EXPIRED_SESSION_ERRNOS
+
+class ConnectionPool:
+    """Bounded pool of Snowflake connections shared by every session of the app.
+
+    Connections are pinged on checkout, replaced when their session has
+    expired, and closed once they have been idle for longer than
+    ``max_idle_seconds``, by a daemon timer when no queries come in.
+    """
+
+    def __init__(self, connect=init_snowflake_connection, max_size=4, max_idle_seconds=600, checkout_timeout=30):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.checkout_timeout = checkout_timeout
+        self._lock = threading.Condition()
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._in_use = 0
+        self._reaper = None
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "checkouts": 0,
+            "reconnects": 0,
+            "reaped": 0,
+            "failed_pings": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+        }
+
+    @contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        except DatabaseError as e:
+            if is_expired_session_error(e):
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(size=len(self._idle) + self._in_use, idle=len(self._idle),
+                         in_use=self._in_use, max_size=self.max_size)
+            return stats
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _checkout(self):
+        with self._lock:
+            expired = self._reap_idle()
+            if not self._idle and self._in_use >= self.max_size:
+                self._stats["waits"] += 1
+                started = time.monotonic()
+                if not self._lock.wait_for(lambda: self._idle or self._in_use < self.max_size,
+                                           timeout=self.checkout_timeout):
+                    raise TimeoutError(f"No Snowflake connection available after {self.checkout_timeout}s")
+                self._stats["wait_seconds"] += time.monotonic() - started
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            conn = self._idle.pop()[0] if self._idle else None
+
+        for stale in expired:
+            self._close(stale)
+        try:
+            if conn is not None and self._ping(conn):
+                with self._lock:
+                    self._stats["reused"] += 1
+                return conn
+            if conn is not None:
+                self._close(conn)
+                with self._lock:
+                    self._stats["reconnects"] += 1
+            conn = self._connect()
+            with self._lock:
+                self._stats["created"] += 1
+            return conn
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def _checkin(self, conn):
+        if conn.is_closed():
+            self._release_slot()
+            return
+        with self._lock:
+            expired = self._reap_idle()
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._schedule_reaper()
+            self._lock.notify()
+        for stale in expired:
+            self._close(stale)
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._stats["reconnects"] += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_use -= 1
+            self._lock.notify()
+
+    def _ping(self, conn):
+        if conn.is_closed():
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except SnowflakeError:
+            with self._lock:
+                self._stats["failed_pings"] += 1
+            return False
+
+    def _reap_idle(self):
+        # Called with the lock held; idle entries are ordered oldest first.
+        # The caller closes the returned connections once the lock is released.
+        cutoff = time.monotonic() - self.max_idle_seconds
+        expired = []
+        while self._idle and self._idle[0][1] < cutoff:
+            expired.append(self._idle.pop(0)[0])
+        self._stats["reaped"] += len(expired)
+        return expired
+
+    def _schedule_reaper(self):
+        # Called with the lock held. One timer at a time, due when the oldest
+        # idle connection expires, so idle sessions close without new traffic.
+        if self._reaper is not None or not self._idle:
+            return
+        delay = self._idle[0][1] + self.max_idle_seconds - time.monotonic()
+        self._reaper = threading.Timer(max(delay, 0) + 0.1, self._reap_in_background)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap_in_background(self):
+        with self._lock:
+            self._reaper = None
+            expired = self._reap_idle()
+            self._schedule_reaper()
+        for conn in expired:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except SnowflakeError:
+            pass
+
+# One pool per server process, shared across sessions and reruns.
+@st.cache_resource
+def get_connection_pool():
+    options = st.secrets["connections"]["snowflake"]
+    return ConnectionPool(
+        max_size=options.get("pool_size", 4),
+        max_idle_seconds=options.get("pool_max_idle_seconds", 600)
+    )
+
+class SnowflakeBackend:
+    """Queries Snowflake through the process-wide connection pool."""
+
+    name = "snowflake"
+    # Aggregations can be pushed down as Snowflake SQL (GROUPING SETS, IFF, ...).
+    pushdown_aggregates = True
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @property
+    def target(self):
+        options = st.secrets["connections"]["snowflake"]
+        return f"snowflake://{options['account']}/{options['database']}/{options['schema']}"
+
+    def connect(self):
+        return init_snowflake_connection()
+
+    def run_query(self, query):
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetch_pandas_all()
+        except DatabaseError as e:
+            if not is_expired_session_error(e):
+                raise
+        # The session expired mid-query; the pool dropped it, so retry once on a fresh login.
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(query)
+            return cur.fetch_pandas_all()
+
+    # Yields Arrow record batches straight from the connector's result chunks.
+    # The pooled connection stays checked out until the generator is exhausted or closed.
+    def run_query_batches(self, query, batch_size=None):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(query)
+            for table in cur.fetch_arrow_batches():
+                yield from table.to_batches(max_chunksize=batch_size)
+
+    def stats(self):
+        return self.pool.stats()
+
+# Backend selected by [query_backend] kind in secrets (or QUERY_BACKEND in the
+# environment): "snowflake" (default) or "duckdb", an embedded database seeded
+# with the same tables for local benchmarking and CI.
+@st.cache_resource
+def get_backend():
+    options = get_config("query_backend")
+    kind = os.environ.get("QUERY_BACKEND", options.get("kind", "snowflake"))
+    if kind == "snowflake":
+        return SnowflakeBackend(get_connection_pool())
+    if kind == "duckdb":
+        from local_backend import DuckDBBackend
+        return DuckDBBackend(
+            employees=options.get("employees", 2000),
+            customers=options.get("customers", 15000),
+            seed=options.get("seed", 0)
+        )
+    raise ValueError(f"Unknown query backend: {kind}")
+
+# Raw connection for the configured backend; prefer run_query, which reuses pooled connections.
+def init_connection():
+    return get_backend().connect()
+
+def connection_pool_stats():
+    backend = get_backend()
+    return dict(backend.stats(), backend=backend.name)
+
+# On-disk result cache shared by every process pointed at the same directory.
+@st.cache_resource
+def get_query_cache():
+    options = get_config("query_cache")
+    return QueryCache(
+        directory=options.get("directory"),
+        max_bytes=options.get("max_bytes", 512 * 1024 * 1024),
+        default_ttl=options.get("default_ttl", 3600)
+    )
+
+# Function to query data from the configured backend. With a ttl (seconds) the
+# result is also persisted in the on-disk query cache, so restarts and other
+# replicas reuse it.
+def run_query(query, ttl=None):
+    backend = get_backend()
+    if ttl is None:
+        return backend.run_query(query)
+    return get_query_cache().get_or_run(query, backend.target, lambda: backend.run_query(query), ttl=ttl)
+
+# Streaming alternative to run_query: yields the result as Arrow record batches,
+# so memory is bounded by the batch rather than the result.
+def run_query_batches(query, batch_size=None):
+    return get_backend().run_query_batches(query, batch_size=batch_size)
+
+def arrow_to_pandas(data):
+    """Arrow table/batch to a pandas frame backed by the Arrow buffers (no NumPy copy)."""
+    if isinstance(data, pa.RecordBatch):
+        data = pa.Table.from_batches([data])
+    return data.to_pandas(types_mapper=pd.ArrowDtype)
+
+def run_query_frames(query, batch_size=None):
+    for batch in run_query_batches(query, batch_size=batch_size):
+        yield arrow_to_pandas(batch)
+
+def stream_dataframe(query, batch_size=None, max_rows=None):
+    """Render a query result incrementally, one Arrow batch at a time.
+
+    One placeholder is redrawn with the rows received so far after each batch.
+    """
+    frames = []
+    rows = 0
+    table = st.empty()
+    status = st.empty()
+    with closing(run_query_frames(query, batch_size=batch_size)) as batches:
+        for frame in batches:
+            if max_rows is not None:
+                frame = frame.head(max_rows - rows)
+            frames.append(frame)
+            rows += len(frame)
+            table.dataframe(pd.concat(frames, ignore_index=True))
+            status.caption(f"{rows:,} rows received")
+            if max_rows is not None and rows >= max_rows:
+                break
+    return rows
@@ -0,0 +1,492 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from google.oauth2 import service_account
+
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    # Storage Read API client is optional; without it results come over the REST API.
+    bigquery_storage = None
+
+
+TRIP_TABLE_ID = "waymo-sandbox.waymo_mockup.trip_data"
+BIGQUERY_TARGET = "bigquery://waymo-sandbox"
+
+# Columns the heat map and table show; the long route_details text is left out.
+TRIP_COLUMNS = [
+    "trip_id", "trip_date", "trip_datetime", "vehicle_id", "start_latitude", "start_longitude",
+    "end_latitude", "end_longitude", "distance_miles", "trip_duration", "payment_amount",
+    "payment_method", "insert_timestamp", "gen_ai_model",
+]
+TRIP_LIMIT = 5000
+# Upper bound on trips held in memory for local filtering (see TripIndex).
+LOCAL_TRIP_CAPACITY = 250_000
+
+# Process-wide counters for BigQuery client setup and traffic.
+CLIENT_METRICS = {
+    "clients_created": 0,
+    "last_client_created_at": None,
+    "requests": 0,
+    "token_refreshes": 0,
+    "storage_api_reads": 0,
+    "rest_reads": 0,
+    "rows_read": 0,
+    "arrow_bytes_read": 0,
+    "bytes_processed": 0,
+}
+_metrics_lock = threading.Lock()
+
+
+def _count(name, value=1):
+    with _metrics_lock:
+        CLIENT_METRICS[name] += value
+
+class MeteredSession(AuthorizedSession):
+    """Authorized requests session that counts requests and token refreshes.
+
+    AuthorizedSession refreshes the access token shortly before it expires
+    (and retries once on a 401), so a long-lived client keeps working without
+    being rebuilt.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        token = self.credentials.token
+        response = super().request(method, url, *args, **kwargs)
+        _count("requests")
+        if self.credentials.token != token:
+            _count("token_refreshes")
+        return response
+
+def _credentials(service_account_info):
+    return service_account.Credentials.from_service_account_info(
+        service_account_info, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+    )
+
+def create_bigquery_client(service_account_info, pool_maxsize=10):
+    credentials = _credentials(service_account_info)
+    session = MeteredSession(credentials)
+    # Keep-alive connections are reused across queries instead of a new TLS handshake each time.
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    client = bigquery.Client(credentials=credentials, project=credentials.project_id, _http=session)
+    _count("clients_created")
+    with _metrics_lock:
+        CLIENT_METRICS["last_client_created_at"] = datetime.now().isoformat(timespec="seconds")
+    return client
+
+def client_metrics():
+    with _metrics_lock:
+        return dict(CLIENT_METRICS)
+
+def create_bqstorage_client(service_account_info):
+    if bigquery_storage is None:
+        return None
+    return bigquery_storage.BigQueryReadClient(credentials=_credentials(service_account_info))
+
+def query_arrow(client, query, bqstorage_client=None, job_config=None):
+    """Run ``query`` and return the result as a pyarrow Table.
+
+    Rows are streamed in Arrow format over the BigQuery Storage Read API when
+    a ``bqstorage_client`` is given, otherwise paged over REST, but either way
+    no per-row Python objects are built.
+    """
+    query_job = client.query(query, job_config=job_config)
+    table = query_job.to_arrow(bqstorage_client=bqstorage_client, create_bqstorage_client=False)
+    _count("bytes_processed", query_job.total_bytes_processed or 0)
+    _count("storage_api_reads" if bqstorage_client is not None else "rest_reads")
+    _count("rows_read", table.num_rows)
+    _count("arrow_bytes_read", table.nbytes)
+    return table
+
+def _trip_filters(start_date, end_date, payment_method=None, gen_ai_model=None):
+    # A missing bound is left out rather than defaulted, so without dates
+    # every trip matches, including those with a NULL trip_date.
+    where, params = [], []
+    if start_date is not None:
+        where.append("trip_date >= @start_date")
+        params.append(bigquery.ScalarQueryParameter("start_date", "DATE", start_date))
+    if end_date is not None:
+        where.append("trip_date <= @end_date")
+        params.append(bigquery.ScalarQueryParameter("end_date", "DATE", end_date))
+    if payment_method:
+        where.append("payment_method = @payment_method")
+        params.append(bigquery.ScalarQueryParameter("payment_method", "STRING", payment_method))
+    if gen_ai_model:
+        where.append("gen_ai_model = @gen_ai_model")
+        params.append(bigquery.ScalarQueryParameter("gen_ai_model", "STRING", gen_ai_model))
+    return " AND ".join(where) or "TRUE", params
+
+def _query_with_params(sql, params):
+    cache_text = sql + " -- " + json.dumps({p.name: str(p.value) for p in params}, sort_keys=True)
+    return sql, bigquery.QueryJobConfig(query_parameters=params), cache_text
+
+def build_trip_query(start_date, end_date, payment_method=None, gen_ai_model=None,
+                     columns=TRIP_COLUMNS, limit=TRIP_LIMIT, inserted_since=None):
+    """Parameterized trip query for the heat map filters.
+
+    Returns ``(sql, job_config, cache_text)``. The trip_date range lets
+    BigQuery prune partitions, and only ``columns`` are scanned.
+    ``cache_text`` is the SQL plus its parameter values, used as the cache key.
+    With ``inserted_since`` only trips inserted at or after that timestamp are returned.
+    """
+    where, params = _trip_filters(start_date, end_date, payment_method, gen_ai_model)
+    if inserted_since is not None:
+        where += " AND insert_timestamp >= @inserted_since"
+        params.append(bigquery.ScalarQueryParameter("inserted_since", "TIMESTAMP", inserted_since))
+    sql = (f"SELECT {', '.join(columns)} FROM `{TRIP_TABLE_ID}` WHERE {where} "
+           f"ORDER BY insert_timestamp DESC LIMIT {int(limit)}")
+    return _query_with_params(sql, params)
+
+def build_route_details_query(trip_id, trip_date):
+    # route_details is long text, so it's fetched for one trip at a time; trip_date prunes partitions.
+    params = [
+        bigquery.ScalarQueryParameter("trip_id", "STRING", trip_id),
+        bigquery.ScalarQueryParameter("trip_date", "DATE", trip_date),
+    ]
+    sql = f"SELECT route_details FROM `{TRIP_TABLE_ID}` WHERE trip_date = @trip_date AND trip_id = @trip_id LIMIT 1"
+    return _query_with_params(sql, params)
+
+# Trip table columns that can be searched (case-insensitive substring) and sorted on.
+TABLE_SEARCH_COLUMNS = ["trip_id", "vehicle_id", "payment_method", "gen_ai_model"]
+TABLE_SORT_COLUMNS = ["insert_timestamp", "trip_datetime", "distance_miles", "trip_duration", "payment_amount"]
+
+def search_trips(table, text, columns=TABLE_SEARCH_COLUMNS):
+    if not text:
+        return table
+    mask = None
+    for column in columns:
+        matches = pc.fill_null(pc.match_substring(table[column].cast(pa.string()), text, ignore_case=True), False)
+        mask = matches if mask is None else pc.or_(mask, matches)
+    return table.filter(mask)
+
+def page_of(table, page, page_size, sort_by=None, descending=False):
+    """Rows of 1-based ``page`` after sorting; only this slice leaves the server."""
+    if sort_by:
+        # Sort the indices, not the table, and gather just the page.
+        order = pc.sort_indices(table, sort_keys=[(sort_by, "descending" if descending else "ascending")])
+        return table.take(order[(page - 1) * page_size:page * page_size])
+    return table.slice((page - 1) * page_size, page_size)
+
+class RecentTrips:
+    """Latest ``capacity`` trips for one filter set, kept up to date incrementally.
+
+    Trips are append-only, so ``refresh()`` asks ``fetch`` only for rows
+    inserted at or after the newest insert_timestamp already held, merges them
+    by trip_id and trims back to the newest ``capacity`` rows. ``fetch(None)``
+    is a full load, which still happens every ``full_refresh_seconds``.
+    """
+
+    def __init__(self, fetch, capacity=TRIP_LIMIT, full_refresh_seconds=24 * 3600):
+        self._fetch = fetch
+        self.capacity = capacity
+        self.full_refresh_seconds = full_refresh_seconds
+        self._lock = threading.Lock()
+        self.totals = {"full_refreshes": 0, "incremental_refreshes": 0, "rows_fetched": 0, "bytes_fetched": 0}
+        self.last_refresh = {}
+        self._index = None
+        self._full_load()
+
+    @property
+    def complete(self):
+        # True while every matching trip fits, i.e. nothing has been trimmed away.
+        return not self.truncated
+
+    @property
+    def index(self):
+        # Rebuilt lazily after a refresh changes the table.
+        index = self._index
+        if index is None or index.table is not self.table:
+            index = self._index = TripIndex(self.table)
+        return index
+
+    @property
+    def watermark(self):
+        if self.table.num_rows == 0:
+            return None
+        return pc.max(self.table["insert_timestamp"]).as_py()
+
+    def refresh_if_stale(self, max_age_seconds):
+        if (datetime.now() - self.refreshed_at).total_seconds() >= max_age_seconds:
+            self.refresh()
+
+    def refresh(self, full=False):
+        with self._lock:
+            if full or (datetime.now() - self.loaded_at).total_seconds() >= self.full_refresh_seconds:
+                self._full_load()
+            else:
+                self._incremental_load()
+        return self.last_refresh
+
+    def stats(self):
+        return {"rows": self.table.num_rows, "complete": self.complete, "watermark": str(self.watermark),
+                "last_refresh": self.last_refresh, **self.totals}
+
+    def _full_load(self):
+        started = time.perf_counter()
+        self.truncated = False
+        table = self._trim(self._fetch(None))
+        self.table = table
+        self.loaded_at = self.refreshed_at = datetime.now()
+        self._record("full", table, started)
+
+    def _incremental_load(self):
+        started = time.perf_counter()
+        watermark = self.watermark
+        if watermark is None:
+            # Nothing matched yet, so there's no watermark to resume from.
+            self._full_load()
+            return
+        delta = self._fetch(watermark)
+        if delta.num_rows:
+            # ">=" re-reads rows sharing the watermark timestamp; drop the held
+            # copies so late arrivals at that instant aren't missed or doubled.
+            old = self.table
+            kept = old.filter(pc.invert(pc.is_in(old["trip_id"], value_set=delta["trip_id"])))
+            self.table = self._trim(pa.concat_tables([delta.select(old.column_names).cast(old.schema), kept]))
+        self.refreshed_at = datetime.now()
+        self._record("incremental", delta, started)
+
+    def _trim(self, table):
+        if table.num_rows > self.capacity:
+            self.truncated = True
+        return table.sort_by([("insert_timestamp", "descending")]).slice(0, self.capacity)
+
+    def _record(self, mode, fetched, started):
+        self.totals[f"{mode}_refreshes"] += 1
+        self.totals["rows_fetched"] += fetched.num_rows
+        self.totals["bytes_fetched"] += fetched.nbytes
+        self.last_refresh = {"mode": mode, "rows_fetched": fetched.num_rows, "bytes_fetched": fetched.nbytes,
+                             "seconds": time.perf_counter() - started}
+
+class TripIndex:
+    """Filter lookups over one trips table without scanning every row.
+
+    trip_date is kept sorted next to its row positions, so a date range is two
+    binary searches; each payment_method / gen_ai_model value maps to its sorted
+    row positions. A query starts from the smallest of those candidate sets and
+    checks the other filters on just those rows, so the cost follows the result
+    size rather than the table size. Recent results are memoized.
+    """
+
+    CATEGORY_COLUMNS = ("payment_method", "gen_ai_model")
+
+    def __init__(self, table, memo_size=32):
+        self.table = table
+        dates = table["trip_date"].to_numpy().astype("datetime64[D]")
+        self._date_order = np.argsort(dates, kind="stable")
+        self._sorted_dates = dates[self._date_order]
+        # NULL trip_dates sort last and match only when no date bound is given.
+        self._dated = int((~np.isnat(dates)).sum())
+        self._dates = dates
+        self._codes = {}
+        self._code_of = {}
+        self._positions = {}
+        for column in self.CATEGORY_COLUMNS:
+            encoded = pc.dictionary_encode(table[column]).combine_chunks()
+            codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(encoded.dictionary) + 1))
+            values = encoded.dictionary.to_pylist()
+            self._codes[column] = codes
+            self._code_of[column] = {value: code for code, value in enumerate(values)}
+            self._positions[column] = {value: order[bounds[code]:bounds[code + 1]] for code, value in enumerate(values)}
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+        self._lock = threading.Lock()
+        self.memo_hits = self.memo_misses = 0
+
+    def positions(self, start_date=None, end_date=None, payment_method=None, gen_ai_model=None):
+        """Sorted row positions of the trips matching every given filter."""
+        key = (start_date, end_date, payment_method, gen_ai_model)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.memo_hits += 1
+                return self._memo[key]
+            self.memo_misses += 1
+        result = self._lookup(start_date, end_date, {"payment_method": payment_method, "gen_ai_model": gen_ai_model})
+        with self._lock:
+            self._memo[key] = result
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return result
+
+    def select(self, start_date=None, end_date=None, payment_method=None, gen_ai_model=None, limit=None):
+        # Table order is kept, so on a RecentTrips table the first rows are the newest.
+        positions = self.positions(start_date, end_date, payment_method, gen_ai_model)
+        return self.table.take(positions[:limit])
+
+    def stats(self):
+        with self._lock:
+            return {"rows": self.table.num_rows, "memoized": len(self._memo),
+                    "memo_hits": self.memo_hits, "memo_misses": self.memo_misses}
+
+    def _lookup(self, start_date, end_date, categories):
+        lo = 0 if start_date is None else np.searchsorted(self._sorted_dates, np.datetime64(start_date, "D"), "left")
+        if end_date is not None:
+            hi = np.searchsorted(self._sorted_dates[:self._dated], np.datetime64(end_date, "D"), "right")
+        else:
+            hi = len(self._sorted_dates) if start_date is None else self._dated
+        candidates = [("trip_date", hi - lo)]
+        for column, value in categories.items():
+            if value is not None:
+                candidates.append((column, len(self._positions[column].get(value, ()))))
+        driver = min(candidates, key=lambda candidate: candidate[1])[0]
+        if driver == "trip_date":
+            rows = np.sort(self._date_order[lo:hi])
+        else:
+            rows = self._positions[driver].get(categories[driver], np.empty(0, dtype="int64"))
+            if start_date is not None or end_date is not None:
+                dates = self._dates[rows]
+                keep = np.ones(len(rows), dtype=bool)
+                if start_date is not None:
+                    keep &= dates >= np.datetime64(start_date, "D")
+                if end_date is not None:
+                    keep &= dates <= np.datetime64(end_date, "D")
+                rows = rows[keep]
+        for column, value in categories.items():
+            if value is None or column == driver:
+                continue
+            # Values not in the table get a code no row has.
+            rows = rows[self._codes[column][rows] == self._code_of[column].get(value, -2)]
+        return rows
+
+# Additive per-bucket measures; means are derived from them, so hourly rows
+# roll up into days (or any other grouping) exactly.
+ROLLUP_KEYS = ["hour", "gen_ai_model", "payment_method"]
+ROLLUP_SUMS = ["trips", "distance_miles", "trip_duration", "payment_amount"]
+
+def build_rollup_query(inserted_since=None):
+    """Hourly trip aggregates per gen_ai_model and payment_method, by insert hour.
+
+    With ``inserted_since`` only hours from that timestamp's hour onward are
+    returned, complete, so they can replace what's held for those hours.
+    """
+    where, params = "TRUE", []
+    if inserted_since is not None:
+        where = "insert_timestamp >= TIMESTAMP_TRUNC(@inserted_since, HOUR)"
+        params.append(bigquery.ScalarQueryParameter("inserted_since", "TIMESTAMP", inserted_since))
+    sql = (f"SELECT TIMESTAMP_TRUNC(insert_timestamp, HOUR) AS hour, gen_ai_model, payment_method, "
+           f"COUNT(*) AS trips, SUM(distance_miles) AS distance_miles, SUM(trip_duration) AS trip_duration, "
+           f"SUM(payment_amount) AS payment_amount, MAX(insert_timestamp) AS last_inserted "
+           f"FROM `{TRIP_TABLE_ID}` WHERE {where} GROUP BY hour, gen_ai_model, payment_method")
+    return _query_with_params(sql, params)
+
+class TripRollups:
+    """Hourly trip rollups kept up to date as trips land.
+
+    Trips are append-only and bucketed by insert hour, so ``refresh()`` only
+    re-aggregates hours from the newest insert_timestamp's hour onward and
+    replaces those rows; older hours never change. A full rebuild still runs
+    every ``full_refresh_seconds``.
+    """
+
+    def __init__(self, fetch, full_refresh_seconds=24 * 3600):
+        self._fetch = fetch
+        self.full_refresh_seconds = full_refresh_seconds
+        self._lock = threading.Lock()
+        self.last_refresh = {}
+        self._full_load()
+
+    @property
+    def watermark(self):
+        return self.hourly["last_inserted"].max() if len(self.hourly) else None
+
+    def refresh_if_stale(self, max_age_seconds):
+        if (datetime.now() - self.refreshed_at).total_seconds() >= max_age_seconds:
+            self.refresh()
+
+    def refresh(self):
+        with self._lock:
+            if (datetime.now() - self.loaded_at).total_seconds() >= self.full_refresh_seconds or self.watermark is None:
+                self._full_load()
+            else:
+                self._incremental_load()
+        return self.last_refresh
+
+    def rollup(self, by, freq=None):
+        """Sums and means grouped by ``by`` columns, optionally per ``freq`` period of the hour ("D", "W", ...)."""
+        hourly = self.hourly
+        keys = list(by)
+        if freq is not None:
+            hourly = hourly.assign(period=hourly["hour"].dt.tz_localize(None).dt.to_period(freq).dt.start_time)
+            keys = ["period"] + keys
+        totals = hourly.groupby(keys, observed=True)[ROLLUP_SUMS].sum().reset_index()
+        for column in ROLLUP_SUMS[1:]:
+            totals[f"mean_{column}"] = totals[column] / totals["trips"]
+        return totals
+
+    def _full_load(self):
+        started = time.perf_counter()
+        hourly = self._frame(self._fetch(None))
+        self.hourly = hourly
+        self.loaded_at = self.refreshed_at = datetime.now()
+        self.last_refresh = {"mode": "full", "rows_fetched": len(hourly), "seconds": time.perf_counter() - started}
+
+    def _incremental_load(self):
+        started = time.perf_counter()
+        delta = self._frame(self._fetch(self.watermark))
+        if len(delta):
+            hourly = self.hourly
+            self.hourly = pd.concat([hourly[hourly["hour"] < delta["hour"].min()], delta], ignore_index=True)
+        self.refreshed_at = datetime.now()
+        self.last_refresh = {"mode": "incremental", "rows_fetched": len(delta), "seconds": time.perf_counter() - started}
+
+    @staticmethod
+    def _frame(table):
+        frame = table.to_pandas()
+        frame["hour"] = pd.to_datetime(frame["hour"], utc=True)
+        frame["last_inserted"] = pd.to_datetime(frame["last_inserted"], utc=True)
+        for column in ROLLUP_SUMS:
+            frame[column] = frame[column].astype("float64")
+        frame["trips"] = frame["trips"].astype("int64")
+        return frame.sort_values("hour", ignore_index=True)
+
+# Heat map grid cell size in degrees (~0.002 deg is ~200 m in San Francisco).
+GRID_CELL_DEGREES = 0.002
+
+def build_binned_trip_query(start_date, end_date, payment_method=None, gen_ai_model=None,
+                            cell_degrees=GRID_CELL_DEGREES, include_end=False):
+    """Like build_trip_query, but counts every matching trip per grid cell.
+
+    Returns one ``lat, lon, weight`` row per occupied cell (cell centers), so the
+    result size is bounded by the grid rather than the number of trips.
+    """
+    where, params = _trip_filters(start_date, end_date, payment_method, gen_ai_model)
+    params.append(bigquery.ScalarQueryParameter("cell", "FLOAT64", cell_degrees))
+    points = [f"SELECT start_latitude AS latitude, start_longitude AS longitude FROM `{TRIP_TABLE_ID}` WHERE {where}"]
+    if include_end:
+        points.append(f"SELECT end_latitude, end_longitude FROM `{TRIP_TABLE_ID}` WHERE {where}")
+    sql = (f"SELECT (FLOOR(latitude / @cell) + 0.5) * @cell AS lat, (FLOOR(longitude / @cell) + 0.5) * @cell AS lon, "
+           f"COUNT(*) AS weight FROM ({' UNION ALL '.join(points)}) "
+           f"WHERE latitude IS NOT NULL AND longitude IS NOT NULL GROUP BY lat, lon")
+    return _query_with_params(sql, params)
+
+def bin_coordinates(latitudes, longitudes, cell_degrees=GRID_CELL_DEGREES):
+    """NumPy equivalent of the binned query for coordinates already in memory."""
+    latitudes = pd.Series(latitudes).to_numpy(dtype="float64", na_value=np.nan)
+    longitudes = pd.Series(longitudes).to_numpy(dtype="float64", na_value=np.nan)
+    valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    cells = np.floor(np.column_stack([latitudes[valid], longitudes[valid]]) / cell_degrees).astype("int64")
+    cells, weights = np.unique(cells, axis=0, return_counts=True)
+    centers = (cells + 0.5) * cell_degrees
+    return pd.DataFrame({"lat": centers[:, 0], "lon": centers[:, 1], "weight": weights})
+
+def heat_points(cells):
+    # folium HeatMap input: [lat, lon, weight] with weights scaled to 0..1.
+    if cells.empty:
+        return []
+    weights = cells["weight"].to_numpy(dtype="float64")
+    return np.column_stack([cells["lat"].to_numpy(dtype="float64"), cells["lon"].to_numpy(dtype="float64"),
+                            weights / weights.max()]).tolist()